@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import github
+import gitguard
+
+"""
+batch.py
+
+Runs the gitguard extractors over many repositories at once: every repo of an
+organisation or user, or a list of owner/repo links.
+
+Repositories are analysed by a bounded pool of threads sharing one GitHub
+client and one connection pool. The client runs at background priority on the
+rate-limit scheduler of the credential's interactive client, so a batch leaves
+github.BACKGROUND_RESERVE of the quota to the bot's commands.
+Results are yielded as each repository finishes and the per-author statistics
+are merged into a leaderboard across all of them.
+
+Usage: python batch.py ORG | OWNER/REPO... [--workers N] [--top N] [--metric METRIC] [--api-url URL]
+"""
+
+WORKERS = 8
+
+def _contributors(repo_link, snapshot):
+    return gitguard.get_repo_contributors(repo_link, snapshot=snapshot)
+
+def _stats(repo_link, snapshot):
+    return gitguard.get_stats_for_all_authors(repo_link, snapshot=snapshot)
+
+def _insertions_deletions(repo_link, snapshot):
+    return gitguard.get_total_insertions_deletions(repo_link, snapshot=snapshot)
+
+def _latest_commit(repo_link, snapshot):
+    return gitguard.get_latest_commit_summary(repo_link, snapshot=snapshot)
+
+# name --> function(repo_link, snapshot) run on every repository
+EXTRACTORS = [
+    ('contributors', _contributors),
+    ('stats', _stats),
+    ('insertions_deletions', _insertions_deletions),
+    ('latest_commit', _latest_commit),
+]
+
+def org_repos(gh, org):
+    """
+    Stream the owner/repo links of an organisation, or of a user if org isn't one.
+    """
+    try:
+        for repo in gh.orgs(org).repos.get.iter(per_page=github.PER_PAGE):
+            yield repo['full_name']
+    except github.ApiNotFoundError:
+        for repo in gh.users(org).repos.get.iter(per_page=github.PER_PAGE):
+            yield repo['full_name']
+
+class Leaderboard(object):
+    """
+    Commits, additions and deletions of every author summed across repositories.
+    """
+
+    def __init__(self):
+        self.authors = {}
+        self.repos = {}
+
+    def add(self, repo_link, stats):
+        """
+        Args:
+            repo_link (str) : owner/repo format
+            stats (dict)    : author's username --> (commits, additions, deletions)
+        """
+        for author, (commits, additions, deletions) in stats.items():
+            c, a, d = self.authors.get(author, (0, 0, 0))
+            self.authors[author] = (c + commits, a + additions, d + deletions)
+            self.repos[author] = self.repos.get(author, 0) + 1
+
+    def top(self, n, metric='commits'):
+        """
+        Args:
+            n (int)         : number of authors
+            metric (str)    : 'commits', 'additions', 'deletions', 'net' or 'repos'
+
+        Returns:
+            list of dict with username, commits, additions, deletions and repos, best first
+        """
+        value = {
+            'commits': lambda entry: entry['commits'],
+            'additions': lambda entry: entry['additions'],
+            'deletions': lambda entry: entry['deletions'],
+            'net': lambda entry: entry['additions'] - entry['deletions'],
+            'repos': lambda entry: entry['repos'],
+        }[metric]
+        entries = (dict(username=author, commits=c, additions=a, deletions=d, repos=self.repos[author])
+                   for author, (c, a, d) in self.authors.items())
+        return gitguard._top_n(entries, n, value)
+
+class BatchAnalysis(object):
+    """
+    Extractors run over many repositories with one shared client.
+
+    Args:
+        username (str)      : github username
+        password (str)      : github password
+        workers (int)       : repositories analysed at the same time
+        extractors (list)   : (name, function(repo_link, snapshot)) pairs, defaults to EXTRACTORS
+        gh                  : (optional) client to share, by default a background priority client
+                              is created for the credential with a connection per worker, on the
+                              scheduler of gitguard's client for the same credential
+    """
+
+    def __init__(self, username=None, password=None, workers=WORKERS, extractors=None, gh=None):
+        self.username = username
+        self.password = password
+        self.workers = workers
+        self.extractors = extractors or EXTRACTORS
+        if gh is None:
+            # one quota per credential: queue behind interactive requests on their scheduler
+            scheduler = gitguard._client(username, password)._scheduler
+            gh = github.GitHub(username=username, password=password, pool_size=workers, plain_json=True,
+                               hooks=gitguard.HOOKS, api_url=gitguard.API_URL,
+                               scheduler=scheduler, priority=github.PRIORITY_BACKGROUND)
+        self.gh = gh
+        self.leaderboard = Leaderboard()
+
+    def _analyse(self, repo_link):
+        start = time.time()
+        snapshot = gitguard.RepoSnapshot(repo_link, self.username, self.password, gh=self.gh)
+        result = dict(repo=repo_link, results={}, error=None)
+        try:
+            for name, extractor in self.extractors:
+                result['results'][name] = extractor(repo_link, snapshot)
+        except Exception as e:
+            # one bad repository, whatever went wrong, mustn't stop the batch
+            result['error'] = e
+        result['elapsed'] = time.time() - start
+        return result
+
+    def run(self, repo_links):
+        """
+        Analyse repositories, yielding each result as soon as it is ready. At most
+        twice as many repositories as workers are queued, so repo_links may be a
+        long stream such as org_repos.
+
+        Args:
+            repo_links      : iterable of owner/repo links
+
+        Returns:
+            generator of dict with repo, results (extractor name --> value), error
+            (None or the exception that stopped the repository) and elapsed seconds
+        """
+        pending = set()
+        with ThreadPoolExecutor(self.workers) as executor:
+            for repo_link in repo_links:
+                pending.add(executor.submit(self._analyse, repo_link))
+                if len(pending) >= 2 * self.workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield self._finish(future.result())
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield self._finish(future.result())
+
+    def run_org(self, org):
+        return self.run(org_repos(self.gh, org))
+
+    def _finish(self, result):
+        stats = result['results'].get('stats')
+        if stats:
+            self.leaderboard.add(result['repo'], stats)
+        return result
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Analyse every repository of an organisation or a list of repositories.')
+    parser.add_argument('targets', nargs='+', help='an organisation or user, or owner/repo links')
+    parser.add_argument('--username')
+    parser.add_argument('--password')
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--top', type=int, default=10, help='size of the leaderboard')
+    parser.add_argument('--metric', default='commits', help='commits, additions, deletions, net or repos')
+    parser.add_argument('--api-url', help='e.g. a github_replay stand-in')
+    args = parser.parse_args(argv[1:])
+
+    if args.api_url:
+        gitguard.set_api_url(args.api_url)
+    analysis = BatchAnalysis(args.username, args.password, args.workers)
+    if len(args.targets) == 1 and '/' not in args.targets[0]:
+        results = analysis.run_org(args.targets[0])
+    else:
+        results = analysis.run(args.targets)
+    start = time.time()
+    count = 0
+    for result in results:
+        count += 1
+        if result['error']:
+            print('%-40s failed: %s' % (result['repo'], result['error']))
+        else:
+            print('%-40s %6.2fs  %d contributors' % (result['repo'], result['elapsed'], len(result['results'].get('contributors') or [])))
+        sys.stdout.flush()
+    print('%d repositories in %.2fs' % (count, time.time() - start))
+    print('')
+    print('%-30s %8s %10s %10s %6s' % ('author', 'commits', 'additions', 'deletions', 'repos'))
+    for entry in analysis.leaderboard.top(args.top, args.metric):
+        print('%-30s %8d %10d %10d %6d' % (entry['username'], entry['commits'], entry['additions'], entry['deletions'], entry['repos']))
+
+if __name__ == '__main__':
+    main(sys.argv)
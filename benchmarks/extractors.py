@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+extractors.py
+
+Offline benchmark of the gitguard extractors and visualizer layouts against
+synthetic repositories served by the github_replay stand-in.
+
+Reports wall time, number of requests served and peak Python memory for each
+extractor on each repository size. Extractors reading a local mirror clone the
+synthetic repositories from git repositories written to a temporary directory.
+
+Usage: python benchmarks/extractors.py [--sizes small,medium,huge] [--latency SECONDS] [--only NAME,...] [--no-memory]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import github
+import github_replay
+import gitguard
+import mirrors
+
+try:
+    import visualizer
+except ImportError as e:
+    # needs plotly and settings_secret.py
+    visualizer = None
+    VISUALIZER_ERROR = e
+
+def _top_author(repo_link):
+    return gitguard.get_top_n_contributors(repo_link, 1)[0]['username']
+
+def _cases():
+    cases = [
+        ('get_top_n_contributors', lambda r: gitguard.get_top_n_contributors(r, 3)),
+        ('get_repo_contributors', lambda r: gitguard.get_repo_contributors(r)),
+        ('get_latest_commit_summary', lambda r: gitguard.get_latest_commit_summary(r)),
+        ('get_commit_history', lambda r: gitguard.get_commit_history(r)),
+        ('get_commit_history(author)', lambda r: gitguard.get_commit_history(r, _top_author(r))),
+        ('get_stats_by_author', lambda r: gitguard.get_stats_by_author(r, _top_author(r))),
+        ('get_stats_for_all_authors', lambda r: gitguard.get_stats_for_all_authors(r)),
+        ('get_top_contributor_in_past_week', lambda r: gitguard.get_top_contributor_in_past_week(r)),
+        ('get_total_insertions_deletions', lambda r: gitguard.get_total_insertions_deletions(r)),
+        ('get_lines_by_author', lambda r: gitguard.get_lines_by_author(r)),
+    ]
+    if visualizer:
+        cases += [
+            ('team_contribution_layout', lambda r: visualizer._get_team_contribution_data_layout(r)),
+            ('team_total_lines_layout', lambda r: visualizer._get_team_total_lines_layout(r)),
+            ('team_commit_history_layout', lambda r: visualizer._get_team_commit_history_data_layout(r, gitguard.get_repo_contributors(r)[:5])),
+        ]
+    return cases
+
+def run_case(server, fn, repo_link, memory):
+    # fresh clients so every case starts with cold caches
+    gitguard.set_api_url(server.url)
+    requests = server.request_count
+    if memory:
+        tracemalloc.start()
+    start = time.time()
+    fn(repo_link)
+    elapsed = time.time() - start
+    peak = 0
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return elapsed, server.request_count - requests, peak
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Benchmark gitguard extractors against synthetic repositories.')
+    parser.add_argument('--sizes', default='small,medium,huge')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--only', default='', help='comma separated case names')
+    parser.add_argument('--no-memory', action='store_true', help='skip tracemalloc, which slows decoding down')
+    args = parser.parse_args(argv[1:])
+
+    sizes = [s for s in args.sizes.split(',') if s]
+    only = set(s for s in args.only.split(',') if s)
+    # don't spend the benchmark sleeping on 202 backoff
+    github.STATS_POLL_DELAY = 0.01
+    repos = github_replay.synthetic_repos(sizes=sizes)
+    # mirrors are cloned from local git repositories instead of github.com
+    tmp = tempfile.mkdtemp(prefix='gitguard-bench-')
+    url_format = github_replay.write_git_remotes(repos, os.path.join(tmp, 'remotes'))
+    gitguard.MIRRORS = mirrors.MirrorStore(root=os.path.join(tmp, 'mirrors'), url_format=url_format)
+    server = github_replay.StandInServer(repos=repos, latency=args.latency).start()
+    if not visualizer:
+        print('skipping visualizer layouts: %s' % VISUALIZER_ERROR)
+    print('%-8s %-34s %10s %9s %12s' % ('size', 'case', 'wall (s)', 'requests', 'peak KiB'))
+    try:
+        for size in sizes:
+            repo_link = 'synthetic/%s' % size
+            for name, fn in _cases():
+                if only and name not in only:
+                    continue
+                elapsed, requests, peak = run_case(server, fn, repo_link, not args.no_memory)
+                print('%-8s %-34s %10.3f %9d %12.1f' % (size, name, elapsed, requests, peak / 1024.0))
+                sys.stdout.flush()
+    finally:
+        server.stop()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+if __name__ == '__main__':
+    main(sys.argv)
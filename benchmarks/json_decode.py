@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+json_decode.py
+
+Compares decode time and peak memory of the JSON decoding paths in github.py
+on a synthetic page of commits shaped like GET /repos/:owner/:repo/commits.
+
+Usage: python benchmarks/json_decode.py [commits_per_page] [repeats]
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import github
+
+COMMIT_FIELDS = ('sha', 'commit.message', 'commit.committer.date')
+
+def _user(i):
+    return {'login': 'user%d' % i, 'id': i, 'avatar_url': 'https://avatars.githubusercontent.com/u/%d?v=3' % i,
+            'url': 'https://api.github.com/users/user%d' % i, 'html_url': 'https://github.com/user%d' % i,
+            'type': 'User', 'site_admin': False}
+
+def make_commits_page(n):
+    page = []
+    for i in range(n):
+        sha = '%040x' % (i * 7919)
+        person = {'name': 'User %d' % i, 'email': 'user%d@example.com' % i, 'date': '2017-04-01T12:%02d:00Z' % (i % 60)}
+        page.append({
+            'sha': sha,
+            'url': 'https://api.github.com/repos/o/r/commits/%s' % sha,
+            'html_url': 'https://github.com/o/r/commit/%s' % sha,
+            'commit': {'author': person, 'committer': dict(person), 'message': 'Commit number %d\n\nSome body text.' % i,
+                       'tree': {'sha': sha, 'url': 'https://api.github.com/repos/o/r/git/trees/%s' % sha},
+                       'comment_count': 0, 'verification': {'verified': False, 'reason': 'unsigned', 'signature': None, 'payload': None}},
+            'author': _user(i),
+            'committer': _user(i + 1),
+            'parents': [{'sha': sha, 'url': 'https://api.github.com/repos/o/r/commits/%s' % sha}],
+        })
+    return json.dumps(page)
+
+def _legacy_decode(jsonstr):
+    # the original object_hook, which re-keyed every field through str()
+    def _obj_hook(pairs):
+        o = github.JsonObject()
+        for k, v in pairs.items():
+            o[str(k)] = v
+        return o
+    return json.loads(jsonstr, object_hook=_obj_hook)
+
+DECODERS = [
+    ('legacy object_hook', _legacy_decode),
+    ('JsonObject', lambda s: github._parse_json(s)),
+    ('plain dict', lambda s: github._parse_json(s, plain=True)),
+    ('plain dict + project', lambda s: github.project(github._parse_json(s, plain=True), COMMIT_FIELDS)),
+]
+
+def measure(decode, payload, repeats):
+    start = time.time()
+    for i in range(repeats):
+        decode(payload)
+    elapsed = (time.time() - start) / repeats
+    tracemalloc.start()
+    result = decode(payload)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, peak, current
+
+def main(argv):
+    n = int(argv[1]) if len(argv) > 1 else 100
+    repeats = int(argv[2]) if len(argv) > 2 else 200
+    payload = make_commits_page(n)
+    print('%d commits, %d bytes, %d repeats' % (n, len(payload), repeats))
+    print('%-22s %12s %14s %14s' % ('decoder', 'ms/page', 'peak KiB', 'retained KiB'))
+    for name, decode in DECODERS:
+        elapsed, peak, current = measure(decode, payload, repeats)
+        print('%-22s %12.3f %14.1f %14.1f' % (name, elapsed * 1000, peak / 1024.0, current / 1024.0))
+
+if __name__ == '__main__':
+    main(sys.argv)
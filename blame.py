@@ -0,0 +1,230 @@
+import multiprocessing
+import os
+import sqlite3
+import git
+import gitlog
+
+"""
+blame.py
+
+Line ownership of a repository: how many lines of the files at a revision
+were last written by each author, from git blame run over a local mirror
+(see mirrors.py).
+
+Files are blamed in parallel in a process pool and the result of every file
+is cached by path and blob sha, so after a new commit only the files it
+changed are blamed again. Files git fails to blame are left out and not
+cached, so they are retried on the next call.
+"""
+
+BLAME_FILE = 'gitguard-blame.sqlite'
+# worker processes, None for one per CPU
+PROCESSES = None
+# files handed to a worker at a time
+CHUNK_SIZE = 16
+# workers are spawned rather than forked, the bot calling us runs threads
+START_METHOD = 'spawn'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS blamed (
+    path TEXT,
+    blob TEXT,
+    PRIMARY KEY (path, blob)
+);
+CREATE TABLE IF NOT EXISTS owners (
+    path TEXT,
+    blob TEXT,
+    author_email TEXT,
+    author_name TEXT,
+    lines INTEGER,
+    sha TEXT
+);
+CREATE INDEX IF NOT EXISTS owners_file ON owners (path, blob);
+CREATE TABLE IF NOT EXISTS logins (
+    author_email TEXT PRIMARY KEY,
+    login TEXT
+);
+'''
+
+_REPOS = {}
+
+def _repo(git_dir):
+    # one git.Repo per worker process
+    repo = _REPOS.get(git_dir)
+    if repo is None:
+        repo = _REPOS[git_dir] = git.Repo(git_dir)
+    return repo
+
+def blame_file(repo, path, rev='HEAD'):
+    """
+    Lines of one file owned by each author, from git blame --incremental.
+
+    Args:
+        repo (git.Repo) : local repository or mirror
+        path (str)      : path to file in repo
+        rev (str)       : revision to blame
+
+    Returns:
+        dict: author email --> [author name, lines, sha of one of the author's commits]
+    """
+    authors = {}
+    owners = {}
+    sha = None
+    lines = 0
+    for line in gitlog.iter_lines(repo, 'blame', '--incremental', rev, '--', path):
+        if sha is None:
+            fields = line.split(' ')
+            sha, lines = fields[0], int(fields[3])
+            continue
+        key, _, value = line.partition(' ')
+        if key == 'author':
+            authors.setdefault(sha, [None, None])[0] = value
+        elif key == 'author-mail':
+            authors.setdefault(sha, [None, None])[1] = value.strip('<>')
+        elif key == 'filename':
+            name, email = authors[sha]
+            owner = owners.get(email)
+            if owner is None:
+                owner = owners[email] = [name, 0, sha]
+            owner[1] += lines
+            sha = None
+    return owners
+
+def _blame_worker(job):
+    git_dir, rev, path, blob = job
+    try:
+        return path, blob, blame_file(_repo(git_dir), path, rev)
+    except git.GitCommandError:
+        # e.g. a lock or a fetch in progress; None so it isn't cached
+        return path, blob, None
+
+def text_files(repo, rev='HEAD'):
+    """
+    Text files at a revision, binary files and submodules excluded.
+
+    Returns:
+        list of (path, blob sha)
+    """
+    text = set()
+    for name in gitlog.iter_fields(repo, 'grep', '-I', '-l', '-z', '-e', '', rev):
+        if name:
+            text.add(name.split(':', 1)[1])
+    files = []
+    for entry in gitlog.iter_fields(repo, 'ls-tree', '-r', '-z', rev):
+        if not entry:
+            continue
+        info, path = entry.split('\t', 1)
+        mode, kind, blob = info.split(' ')
+        if kind == 'blob' and mode != '120000' and path in text:
+            files.append((path, blob))
+    return files
+
+class LineOwnership(object):
+    """
+    Cached line ownership of one repository.
+
+    Args:
+        path (str)  : SQLite database file, created if missing
+    """
+
+    def __init__(self, path):
+        self.path = path
+        connection = self._connect()
+        try:
+            connection.executescript(SCHEMA)
+        finally:
+            connection.close()
+
+    @classmethod
+    def for_repo(cls, repo):
+        """
+        Cache stored inside a mirror, so it is evicted together with it.
+        """
+        return cls(os.path.join(repo.git_dir, BLAME_FILE))
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        return connection
+
+    def compute(self, repo, rev='HEAD', processes=None):
+        """
+        Lines owned by each author at a revision. Only files whose blob isn't
+        cached yet are blamed; entries of files no longer at rev are dropped.
+        Files git fails to blame are left out of the result.
+
+        Args:
+            repo (git.Repo)     : local repository or mirror the cache belongs to
+            rev (str)           : revision to blame
+            processes (int)     : (optional) worker processes, defaults to PROCESSES
+
+        Returns:
+            dict: author email --> (author name, lines, sha of one of the author's commits)
+        """
+        files = text_files(repo, rev)
+        connection = self._connect()
+        try:
+            cached = set(connection.execute('SELECT path, blob FROM blamed').fetchall())
+            jobs = [(repo.git_dir, rev, path, blob) for path, blob in files if (path, blob) not in cached]
+            if jobs:
+                self._blame(connection, jobs, processes or PROCESSES)
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('CREATE TEMP TABLE current (path TEXT, blob TEXT, PRIMARY KEY (path, blob))')
+            connection.executemany('INSERT OR IGNORE INTO current VALUES (?, ?)', files)
+            connection.execute('DELETE FROM owners WHERE (path, blob) NOT IN (SELECT path, blob FROM current)')
+            connection.execute('DELETE FROM blamed WHERE (path, blob) NOT IN (SELECT path, blob FROM current)')
+            connection.execute('COMMIT')
+            rows = connection.execute('SELECT author_email, MAX(author_name), SUM(lines), MAX(sha) '
+                                      'FROM owners GROUP BY author_email').fetchall()
+        finally:
+            connection.close()
+        return dict((email, (name, lines, sha)) for email, name, lines, sha in rows)
+
+    def _blame(self, connection, jobs, processes):
+        if processes == 1 or len(jobs) == 1:
+            results = map(_blame_worker, jobs)
+            pool = None
+        else:
+            pool = multiprocessing.get_context(START_METHOD).Pool(processes)
+            results = pool.imap_unordered(_blame_worker, jobs, CHUNK_SIZE)
+        try:
+            done = []
+            for result in results:
+                done.append(result)
+                if len(done) >= CHUNK_SIZE * 8:
+                    self._save(connection, done)
+            self._save(connection, done)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+    def _save(self, connection, done):
+        connection.execute('BEGIN IMMEDIATE')
+        for path, blob, owners in done:
+            if owners is None:
+                continue
+            rows = [(path, blob, email, name, lines, sha) for email, (name, lines, sha) in owners.items()]
+            connection.execute('DELETE FROM owners WHERE path = ? AND blob = ?', (path, blob))
+            connection.executemany('INSERT INTO owners VALUES (?, ?, ?, ?, ?, ?)', rows)
+            connection.execute('INSERT OR IGNORE INTO blamed VALUES (?, ?)', (path, blob))
+        connection.execute('COMMIT')
+        del done[:]
+
+    def logins(self):
+        """
+        Returns:
+            dict: author email --> GitHub username, None if the email has no account
+        """
+        connection = self._connect()
+        try:
+            return dict(connection.execute('SELECT author_email, login FROM logins').fetchall())
+        finally:
+            connection.close()
+
+    def save_logins(self, logins):
+        connection = self._connect()
+        try:
+            connection.executemany('INSERT OR REPLACE INTO logins VALUES (?, ?)', list(logins.items()))
+        finally:
+            connection.close()
@@ -213,4 +213,6 @@ def team_lines_contribution(bot, update, args):
 team_lines_contribution_handler = CommandHandler('team_lines_contribution', team_lines_contribution, pass_args=True)
 dispatcher.add_handler(team_lines_contribution_handler)
 
-updater.start_polling()
+# blame's worker processes import this module again, they mustn't poll
+if __name__ == '__main__':
+    updater.start_polling()
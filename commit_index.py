@@ -0,0 +1,250 @@
+import os
+import re
+import sqlite3
+import git
+import gitlog
+
+"""
+commit_index.py
+
+Persistent SQLite index of the commits of one repository, built from its
+local mirror (see mirrors.py) and kept up to date incrementally from the last
+indexed commit.
+
+Commit history, per-author statistics and per-file history become indexed
+queries instead of a walk over the whole history.
+"""
+
+INDEX_FILE = 'gitguard-index.sqlite'
+# commits inserted per executemany while indexing
+BATCH_SIZE = 1000
+
+# logins are only known locally for GitHub's noreply addresses
+NOREPLY_EMAIL_REGEX = re.compile(r'^(?:\d+\+)?([^@+]+)@users\.noreply\.github\.com$', re.IGNORECASE)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS commits (
+    sha TEXT PRIMARY KEY,
+    author_login TEXT,
+    author_name TEXT,
+    author_email TEXT,
+    author_time INTEGER,
+    committer_time INTEGER,
+    subject TEXT,
+    message TEXT,
+    merge INTEGER,
+    additions INTEGER,
+    deletions INTEGER
+);
+CREATE TABLE IF NOT EXISTS files (
+    sha TEXT,
+    path TEXT,
+    additions INTEGER,
+    deletions INTEGER
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS commits_author_login ON commits (author_login);
+CREATE INDEX IF NOT EXISTS commits_author_name ON commits (author_name);
+CREATE INDEX IF NOT EXISTS commits_author_email ON commits (author_email);
+CREATE INDEX IF NOT EXISTS commits_committer_time ON commits (committer_time);
+CREATE INDEX IF NOT EXISTS files_path ON files (path, sha);
+CREATE INDEX IF NOT EXISTS files_sha ON files (sha);
+'''
+
+def login_from_email(email):
+    """
+    GitHub username of a noreply commit email, None for any other address.
+    """
+    match = NOREPLY_EMAIL_REGEX.match(email or '')
+    return match.group(1) if match else None
+
+def _rows(commits, files):
+    for commit in commits:
+        additions = 0
+        deletions = 0
+        for path, adds, dels in commit['files']:
+            additions += adds or 0
+            deletions += dels or 0
+            files.append((commit['sha'], path, adds, dels))
+        yield (commit['sha'], login_from_email(commit['author_email']), commit['author_name'],
+               commit['author_email'], commit['author_time'], commit['committer_time'],
+               commit['message'].split('\n', 1)[0], commit['message'], int(len(commit['parents']) > 1),
+               additions, deletions)
+
+class CommitIndex(object):
+    """
+    Index of the commits reachable from HEAD of a local repository.
+
+    Args:
+        path (str)  : SQLite database file, created if missing
+    """
+
+    def __init__(self, path):
+        self.path = path
+        connection = self._connect()
+        try:
+            connection.executescript(SCHEMA)
+        finally:
+            connection.close()
+
+    @classmethod
+    def for_repo(cls, repo):
+        """
+        Index stored inside a mirror, so it is evicted together with it.
+        """
+        return cls(os.path.join(repo.git_dir, INDEX_FILE))
+
+    def _connect(self):
+        # one connection per call, sqlite3 connections can't be shared between threads
+        connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        return connection
+
+    def head(self):
+        """
+        Returns:
+            str: sha of the last indexed HEAD, None if nothing is indexed yet
+        """
+        connection = self._connect()
+        try:
+            row = connection.execute("SELECT value FROM meta WHERE key = 'head'").fetchone()
+            return row[0] if row else None
+        finally:
+            connection.close()
+
+    def update(self, repo, rev='HEAD'):
+        """
+        Index the commits added to repo since the last update. The whole index
+        is rebuilt if the last indexed commit is no longer an ancestor of rev,
+        e.g. after a force push.
+
+        Args:
+            repo (git.Repo) : local repository or mirror the index belongs to
+            rev (str)       : revision to index
+
+        Returns:
+            int: number of commits indexed
+        """
+        head = repo.git.rev_parse(rev)
+        connection = self._connect()
+        try:
+            # serialise writers across threads and processes
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute("SELECT value FROM meta WHERE key = 'head'").fetchone()
+            last = row[0] if row else None
+            if last == head:
+                connection.execute('ROLLBACK')
+                return 0
+            if last and self._is_ancestor(repo, last, head):
+                revs = ('%s..%s' % (last, head),)
+            else:
+                connection.execute('DELETE FROM commits')
+                connection.execute('DELETE FROM files')
+                revs = (head,)
+            count = 0
+            batch = []
+            files = []
+            for row in _rows(gitlog.iter_numstat(repo, *revs), files):
+                batch.append(row)
+                if len(batch) >= BATCH_SIZE:
+                    count += self._insert(connection, batch, files)
+            count += self._insert(connection, batch, files)
+            connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('head', ?)", (head,))
+            connection.execute('COMMIT')
+            return count
+        except:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            raise
+        finally:
+            connection.close()
+
+    def _is_ancestor(self, repo, ancestor, rev):
+        try:
+            repo.git.merge_base('--is-ancestor', ancestor, rev)
+            return True
+        except git.GitCommandError:
+            return False
+
+    def _insert(self, connection, batch, files):
+        count = len(batch)
+        connection.executemany('INSERT OR IGNORE INTO commits VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', batch)
+        connection.executemany('INSERT INTO files VALUES (?, ?, ?, ?)', files)
+        del batch[:]
+        del files[:]
+        return count
+
+    def _query(self, sql, params):
+        connection = self._connect()
+        try:
+            return connection.execute(sql, params).fetchall()
+        finally:
+            connection.close()
+
+    def commits(self, author=None, since=None, until=None, path=None):
+        """
+        Commits newest first, optionally filtered.
+
+        Args:
+            author (str)    : (optional) login, name or email of the author
+            since (int)     : (optional) unix timestamp of the oldest commit date to include
+            until (int)     : (optional) unix timestamp of the newest commit date to include
+            path (str)      : (optional) only commits touching this file
+
+        Returns:
+            list of (sha, author_login, author_name, subject, message, committer_time)
+        """
+        sql = 'SELECT c.sha, c.author_login, c.author_name, c.subject, c.message, c.committer_time FROM commits c'
+        where = []
+        params = []
+        if path:
+            sql += ' JOIN files f ON f.sha = c.sha'
+            where.append('f.path = ?')
+            params.append(path)
+        if author:
+            where.append('(c.author_login = ? OR c.author_name = ? OR c.author_email = ?)')
+            params += [author, author, author]
+        if since is not None:
+            where.append('c.committer_time >= ?')
+            params.append(since)
+        if until is not None:
+            where.append('c.committer_time <= ?')
+            params.append(until)
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY c.committer_time DESC'
+        return self._query(sql, params)
+
+    def iter_stats_by_author(self, since=None, until=None):
+        """
+        Commits, additions and deletions of every author, merges excluded as in
+        GitHub's contributor statistics, streamed from the database. Authors are
+        keyed by login where it is known and by name otherwise.
+
+        Args:
+            since (int)     : (optional) unix timestamp of the oldest commit date to include
+            until (int)     : (optional) unix timestamp; only commits before it are included
+
+        Returns:
+            generator of (author, commits, additions, deletions)
+        """
+        sql = ('SELECT COALESCE(author_login, author_name), COUNT(*), SUM(additions), SUM(deletions) '
+               'FROM commits WHERE merge = 0 AND committer_time >= ? AND committer_time < ? '
+               'GROUP BY COALESCE(author_login, author_name)')
+        connection = self._connect()
+        try:
+            for row in connection.execute(sql, (since if since is not None else 0, until if until is not None else 2 ** 62)):
+                yield row
+        finally:
+            connection.close()
+
+    def stats_by_author(self, since=None, until=None):
+        """
+        Returns:
+            dict: author --> (commits, additions, deletions), see iter_stats_by_author
+        """
+        return dict((author, (commits, additions, deletions))
+                    for author, commits, additions, deletions in self.iter_stats_by_author(since, until))
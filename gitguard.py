@@ -4,10 +4,17 @@ import datetime
 import git
 import re
 import os
-import shutil
-import stat
-import subprocess
-from git import Repo
+import threading
+import time
+import hashlib
+import heapq
+import contextlib
+import mirrors
+import gitlog
+import commit_index
+import blame
+import weekly_stats
+import profiles
 
 """
 gitguard_extractor.py
@@ -19,7 +26,103 @@ repo_link is in the format USER/REPO_NAME or ORGANIZATION/REPO_NAME
 
 REGEX_REPO_LINK_DELIMITER = '\s*/\s*'
 REPO_LINK_REGEX = re.compile(REGEX_REPO_LINK_DELIMITER)
-GITHUB = github.GitHub()
+# hooks shared by every client gitguard creates, e.g. github.MetricsCollector().install(GITHUB)
+HOOKS = {}
+# None for api.github.com; see set_api_url
+API_URL = None
+GITHUB = github.GitHub(plain_json=True, hooks=HOOKS)
+# local bare mirrors used by the file and line history extractors
+MIRRORS = mirrors.MirrorStore()
+
+# where history and statistics are read from: the REST API, a walk over a local
+# mirror, or the SQLite commit index kept next to the mirror
+BACKEND_API = 'api'
+BACKEND_LOCAL = 'local'
+BACKEND_INDEX = 'index'
+COMMIT_HISTORY_BACKEND = BACKEND_API
+STATS_BACKEND = BACKEND_API
+FILE_HISTORY_BACKEND = BACKEND_LOCAL
+
+# user profiles (login --> name) shared by every client; see get_names_from_usernames
+PROFILES = profiles.UserProfileCache(os.path.join(mirrors.MIRROR_ROOT, profiles.PROFILES_FILE))
+# profiles.RESOLVER_REST or profiles.RESOLVER_GRAPHQL (authenticated clients only)
+PROFILE_RESOLVER = profiles.RESOLVER_REST
+
+# seconds validation results are remembered for
+VALIDATION_TTL = 600
+INVALID_TTL = 60
+
+class _TTLCache(object):
+    """
+    Thread-safe dict whose entries expire after a per-entry time to live.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns:
+            tuple: (True, value) if key is cached and fresh, (False, None) otherwise
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return False, None
+            return True, entry[1]
+
+    def put(self, key, value, ttl):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                now = time.time()
+                for k in [k for k, e in self._entries.items() if e[0] < now]:
+                    del self._entries[k]
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+            self._entries[key] = (time.time() + ttl, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+_VALIDATIONS = _TTLCache()
+
+def set_api_url(api_url):
+    """
+    Point gitguard at another GitHub API, e.g. a github_replay stand-in.
+    """
+    global API_URL, GITHUB
+    API_URL = api_url
+    GITHUB = github.GitHub(plain_json=True, hooks=HOOKS, api_url=api_url)
+    with _CLIENTS_LOCK:
+        _CLIENTS.clear()
+    _VALIDATIONS.clear()
+
+def _credential_key(username, password):
+    if username and password:
+        return (username, hashlib.sha256(password.encode('utf-8')).hexdigest())
+    return None
+
+def _client(username=None, password=None):
+    """
+    Returns the client registered for a credential, creating it on first use,
+    so its connection pool, response cache and rate-limit budget are reused.
+    """
+    key = _credential_key(username, password)
+    if key is None:
+        return GITHUB
+    with _CLIENTS_LOCK:
+        gh = _CLIENTS.get(key)
+        if gh is None:
+            gh = _CLIENTS[key] = github.GitHub(username=username, password=password, plain_json=True, hooks=HOOKS, api_url=API_URL)
+        return gh
 
 def is_repo_link_valid(repo_link, username=None, password=None):
     """
@@ -30,6 +133,7 @@ def is_repo_link_valid(repo_link, username=None, password=None):
 
     Returns:
         bool: True if repository exists (valid owner and repo_name) AND repository is public, False otherwise
+        results are remembered for VALIDATION_TTL seconds, INVALID_TTL if False
     """
 
     owner = repo = ''
@@ -38,11 +142,17 @@ def is_repo_link_valid(repo_link, username=None, password=None):
     except ValueError:
         return False
 
+    key = ('repo', owner.lower(), repo.lower(), _credential_key(username, password))
+    found, valid = _VALIDATIONS.get(key)
+    if found:
+        return valid
     try:
-        gh = github.GitHub(username=username, password=password) if username and password else GITHUB
+        gh = _client(username, password)
         gh.repos(owner)(repo).get()
+        _VALIDATIONS.put(key, True, VALIDATION_TTL)
         return True
     except github.ApiNotFoundError:
+        _VALIDATIONS.put(key, False, INVALID_TTL)
         return False
 
 def is_user_valid(username, password):
@@ -55,36 +165,128 @@ def is_user_valid(username, password):
 
     Returns:
         bool: True if user credentials is valid. False if otherwise
+        results are remembered for VALIDATION_TTL seconds, INVALID_TTL if False
     """
 
-    gh = github.GitHub(username=username, password=password)
+    key = ('user', _credential_key(username, password))
+    found, valid = _VALIDATIONS.get(key)
+    if found:
+        return valid
+    gh = _client(username, password)
     try:
-        gh.users('githubpy').followers.get()
+        # GET /user only succeeds for the authenticated user
+        gh.user.get()
+        _VALIDATIONS.put(key, True, VALIDATION_TTL)
         return True
-    except github.ApiError:
+    except github.ApiError as e:
+        # only remember rejected credentials, not rate limits or outages
+        if e.response and e.response.code == 401:
+            _VALIDATIONS.put(key, False, INVALID_TTL)
         return False
 
-def _get_user(username):
-    return GITHUB.users(username).get()
+def get_names_from_usernames(logins, username=None, password=None, snapshot=None):
+    """
+    Retrieves the profile names of many users at once. Names are cached on disk
+    for profiles.PROFILE_TTL; the others are fetched together with the caller's
+    credentials
+
+    Args:
+        logins (list)   : github usernames to look up
+        username (str)  : github username
+        password (str)  : github password
+        snapshot        : (optional) RepoSnapshot whose client is used
+
+    Returns:
+        dict: username --> the user's name, None if no such username found
+    """
+    gh = snapshot.gh if snapshot else _client(username, password)
+    return PROFILES.resolve(gh, logins, PROFILE_RESOLVER)
 
-def get_name_from_username(username):
+def get_name_from_username(username, snapshot=None):
     """
     Retrieves a user's profile name from their username
 
     Args:
         username (str): github username
+        snapshot      : (optional) RepoSnapshot whose client, and so credentials, is used
 
     Returns:
         str: the user's name, None if no such username found
     """
-    try:
-        return _get_user(username)['name']
-    except github.ApiNotFoundError:
-        return None
+    return get_names_from_usernames([username], snapshot=snapshot)[username]
+
+class RepoSnapshot(object):
+    """
+    API resources of one repository for one credential, each fetched on first
+    use and memoized. Pass the same snapshot to several extractors (snapshot=)
+    so a composite command never fetches a resource twice.
+
+    Args:
+        repo_link (str) : the repository link in the format owner/repo_name
+        username (str)  : github username
+        password (str)  : github password
+        gh              : (optional) client to use instead of the one registered for the credential
+    """
 
-def get_repo_contributors(repo_link, username=None, password=None):
-    gh = github.GitHub(username=username, password=password) if username and password else GITHUB
-    contributors = _get_contributors_from_api(repo_link, gh)
+    def __init__(self, repo_link, username=None, password=None, gh=None):
+        self.repo_link = repo_link
+        self.username = username
+        self.password = password
+        self.gh = gh or _client(username, password)
+        self._resources = {}
+        self._lock = threading.Lock()
+
+    def _memoize(self, key, fetch):
+        with self._lock:
+            if key in self._resources:
+                return self._resources[key]
+        value = fetch()
+        with self._lock:
+            return self._resources.setdefault(key, value)
+
+    def contributors(self):
+        return self._memoize('contributors', lambda: list(_get_contributors_from_api(self.repo_link, self.gh)))
+
+    def iter_contributors(self, per_page=github.PER_PAGE, **query):
+        """
+        Contributors in descending order of contributions; streamed page by page
+        unless the full list has already been fetched. query is passed to the
+        API, e.g. anon=1 to include anonymous contributors.
+        """
+        with self._lock:
+            contributors = self._resources.get('contributors')
+        if contributors is not None and not query:
+            return iter(contributors)
+        return _get_contributors_from_api(self.repo_link, self.gh, per_page=per_page, **query)
+
+    def commits(self, fields=None, **query):
+        """
+        All commits matching query (author, since, until, path), optionally
+        projected to the given dotted fields.
+        """
+        key = ('commits', fields, tuple(sorted(query.items())))
+        return self._memoize(key, lambda: list(_get_commits_from_api(self.repo_link, self.gh, fields, **query)))
+
+    def latest_commit(self):
+        return self._memoize('latest_commit', lambda: _get_latest_commit_from_api(self.repo_link, self.gh))
+
+    def contributor_stats(self):
+        return self._memoize('contributor_stats', lambda: _get_contributor_stats(self.repo_link, self.gh) or [])
+
+    def stats_by_author(self):
+        return self._memoize('stats_by_author', lambda: self.contributor_matrix().by_author())
+
+    def contributor_matrix(self):
+        return self._memoize('contributor_matrix', lambda: weekly_stats.ContributorMatrix.from_stats(self.contributor_stats()))
+
+    def code_frequency(self):
+        return self._memoize('code_frequency', lambda: _get_code_frequency(self.repo_link, self.gh) or [])
+
+def _snapshot(repo_link, username, password, snapshot):
+    return snapshot or RepoSnapshot(repo_link, username, password)
+
+def get_repo_contributors(repo_link, username=None, password=None, snapshot=None):
+    contributors = _snapshot(repo_link, username, password, snapshot).contributors()
     contributor_list = []
     for contributor in contributors:
         contributor_list.append(contributor['login'])
@@ -94,50 +296,112 @@ def process_repo_link(repo_link):
     #returns owner, repo_name
     return REPO_LINK_REGEX.split(repo_link)
 
-def _get_contributors_from_api(repo_link, gh):
+def _get_contributors_from_api(repo_link, gh, **kw):
     owner, repo = process_repo_link(repo_link)
-    # connect to github API
-    return gh.repos(owner)(repo).contributors.get()
+    # connect to github API; pages are fetched lazily as the result is consumed
+    return gh.repos(owner)(repo).contributors.get.iter(**kw)
 
-def get_top_n_contributors(repo_link, n, username = None, password = None):
+# metrics get_top_n_contributors can rank by
+TOP_METRICS = ('contributions', 'commits', 'additions', 'deletions', 'net')
+
+def _top_n(entries, n, key):
+    """
+    Helper function to keep the n entries with the largest key of a stream, in O(n) memory.
+    Ties keep the entry seen first
+
+    Return:
+        list of entries in descending order of key
+    """
+    heap = []
+    for order, entry in enumerate(entries):
+        item = (key(entry), -order, entry)
+        if len(heap) < n:
+            heapq.heappush(heap, item)
+        elif item[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, item)
+    return [entry for value, order, entry in sorted(heap, key=lambda item: item[:2], reverse=True)]
+
+def _iter_author_stats(repo_link, username, password, snapshot, since, until, backend):
+    """
+    Helper function to stream (username, commits, additions, deletions) of every author
+    within [since, until), from contributor statistics or the commit index. Statistics are
+    summed author by author from the payload rather than through the contributor matrix
+    """
+    if (backend or STATS_BACKEND) == BACKEND_INDEX:
+        with _commit_index(repo_link) as index:
+            for row in index.iter_stats_by_author(since, until):
+                yield row
+        return
+    repo_data = _snapshot(repo_link, username, password, snapshot).contributor_stats()
+    for row in weekly_stats.iter_author_totals(repo_data, since, until):
+        yield row
+
+def get_top_n_contributors(repo_link, n, username = None, password = None, snapshot=None, metric='contributions', since=None, until=None, anonymous=False, backend=None):
     """
     Extracts top contributors for a given repository.
 
     Args:
         repo_link (str) : the repository link in the format owner/repo_name
         n (int)         : top n contributors; must be greater than 0
+        snapshot        : (optional) RepoSnapshot shared with other extractors
+        metric (str)    : one of TOP_METRICS. 'contributions' ranks every page of the contributors
+                          list; the others rank commits, additions, deletions or additions minus
+                          deletions from contributor statistics or the commit index
+        since (int)     : (optional) unix timestamp; only count activity from then on.
+                          not available for 'contributions'
+        until (int)     : (optional) unix timestamp; only count activity before then.
+                          not available for 'contributions'
+        anonymous (bool): include contributors without a GitHub account, 'contributions' only
+        backend (str)   : (optional) BACKEND_API or BACKEND_INDEX for the statistics metrics,
+                          defaults to STATS_BACKEND
+
+    Authors are ranked through a heap of n entries. 'contributions' and the commit index
+    are streamed, so memory is O(n); contributor statistics come as one payload, which is
+    held in full, but are ranked without building the authors x weeks matrix.
 
     Returns:
         list:   top contributors in descending order of contributions
                 the n-th element of the list is the top (n+1)th contributor
-                each element is a dict containing ['username'] and ['contributions']
+                each element is a dict containing ['username'] and ['contributions'], the value
+                of the metric; anonymous contributors have their name as username.
+                the statistics metrics also give ['commits'], ['additions'] and ['deletions']
     """
     assert n > 0
-
-    persons = 0
-    gh = github.GitHub(username=username, password=password) if username and password else GITHUB
-    contributors = _get_contributors_from_api(repo_link, gh)
-
-    contributions = []
-    for contributor in contributors:
-        this_contributor = {}
-        this_contributor['username'] = contributor['login']
-        this_contributor['contributions'] = contributor['contributions']
-        contributions.append(this_contributor)
-
-        persons += 1
-        # only show top n contributors
-        if persons >= n:
-            break
-
-    return contributions
-
-def _get_commits_from_api(repo_link, gh):
+    if metric not in TOP_METRICS:
+        raise ValueError('metric must be one of %s' % ', '.join(TOP_METRICS))
+
+    if metric == 'contributions':
+        if since is not None or until is not None:
+            raise ValueError('the contributors list has no time window, rank by commits instead')
+        query = dict(anon=1) if anonymous else {}
+        contributors = _snapshot(repo_link, username, password, snapshot).iter_contributors(**query)
+        top = _top_n(contributors, n, lambda contributor: contributor['contributions'])
+        return [{'username': contributor.get('login') or contributor.get('name'), 'contributions': contributor['contributions']}
+                for contributor in top]
+
+    value = {
+        'commits': lambda stats: stats[1],
+        'additions': lambda stats: stats[2],
+        'deletions': lambda stats: stats[3],
+        'net': lambda stats: stats[2] - stats[3],
+    }[metric]
+    top = _top_n(_iter_author_stats(repo_link, username, password, snapshot, since, until, backend), n, value)
+    return [{'username': stats[0], 'contributions': value(stats), 'commits': stats[1], 'additions': stats[2], 'deletions': stats[3]}
+            for stats in top]
+
+def _get_commits_from_api(repo_link, gh, fields=None, **kw):
     owner, repo = process_repo_link(repo_link)
     # GET /repos/:owner/:repo/commits
-    return gh.repos(owner)(repo).commits.get()
+    commits = gh.repos(owner)(repo).commits.get
+    if fields:
+        commits = commits.select(*fields)
+    return commits.iter(**kw)
 
-def get_latest_commit_summary(repo_link, username=None, password=None):
+def _get_latest_commit_from_api(repo_link, gh):
+    owner, repo = process_repo_link(repo_link)
+    return gh.repos(owner)(repo).commits.get(per_page=1)[0]
+
+def get_latest_commit_summary(repo_link, username=None, password=None, snapshot=None):
     """
     Extracts latest commit info for a given repository.
 
@@ -145,13 +409,13 @@ def get_latest_commit_summary(repo_link, username=None, password=None):
         repo_link (str) : the repository link in the format owner/repo_name
         username (str): github username
         password (str): github password
+        snapshot        : (optional) RepoSnapshot shared with other extractors
 
     Returns:
         dict: ['user'] --> {'name', 'email', 'username'}, ['message'], ['timestamp']
     """
 
-    gh = github.GitHub(username=username, password=password) if username and password else GITHUB
-    latest_commit = _get_commits_from_api(repo_link, gh)[0]
+    latest_commit = _snapshot(repo_link, username, password, snapshot).latest_commit()
     latest_commit_dict = {}
     latest_commit_dict['user'] = {}
 
@@ -167,14 +431,20 @@ def _get_contributor_stats(repo_link, gh):
     owner, repo = process_repo_link(repo_link)
     return gh.repos(owner)(repo).stats.contributors.get()
 
-def get_top_contributor_in_past_week(repo_link, username=None, password=None):
+def _get_code_frequency(repo_link, gh):
+    owner, repo = process_repo_link(repo_link)
+    return gh.repos(owner)(repo).stats.code_frequency.get()
+
+def get_top_contributor_in_past_week(repo_link, username=None, password=None, snapshot=None):
     """
-    Return top contributor of within the last week
+    Return top contributor of within the last week, the last full week (Sunday to
+    Saturday, UTC) of stats/contributors
 
     Args:
         repo_link (str) : the repository link in the format owner/repo_name
         username (str): github username
         password (str): github password
+        snapshot        : (optional) RepoSnapshot shared with other extractors
 
     Returns:
         dict:   {   'username': <username>,
@@ -183,13 +453,19 @@ def get_top_contributor_in_past_week(repo_link, username=None, password=None):
                     'additions': <additions>
                     'deletions': <deletions>
                 }
+        None if nobody committed that week
     """
-    gh = github.GitHub(username=username, password=password) if username and password else GITHUB
-    top = _get_contributor_stats(repo_link, gh)[-1]
+    snapshot = _snapshot(repo_link, username, password, snapshot)
+    matrix = snapshot.contributor_matrix()
+    start, end = matrix.last_full_week(time.time())
+    top = matrix.top(1, start, end)
+    if not top or top[0][1] == 0:
+        return None
+    login, commits, additions, deletions = top[0]
 
-    return {'username': top['author']['login'], 'name': get_name_from_username(top['author']['login']), 'commits': top['weeks'][0]['c'], 'additions': top['weeks'][0]['a'], 'deletions': top['weeks'][0]['d']}
+    return {'username': login, 'name': get_name_from_username(login, snapshot), 'commits': commits, 'additions': additions, 'deletions': deletions}
 
-def get_total_insertions_deletions(repo_link, username=None, password=None):
+def get_total_insertions_deletions(repo_link, username=None, password=None, snapshot=None):
     """
     Return the total number of insertions and deletions
     API: GET /repos/:owner/:repo/stats/code_frequency
@@ -198,21 +474,14 @@ def get_total_insertions_deletions(repo_link, username=None, password=None):
         repo_link (str) : the repository link in the format owner/repo_name
         username (str): github username
         password (str): github password
+        snapshot        : (optional) RepoSnapshot shared with other extractors
 
     Returns:
         insertions, deletions
     """
-    owner, repo = process_repo_link(repo_link)
-    gh = github.GitHub(username=username, password=password) if username and password else GITHUB
-    weekly_data = gh.repos(owner)(repo).stats.code_frequency.get();
-    adds = 0
-    dels = 0
-    for week in weekly_data:
-        adds += week[1]
-        dels += week[2]
-    return adds, dels * -1
+    return weekly_stats.code_frequency_totals(_snapshot(repo_link, username, password, snapshot).code_frequency())
 
-def get_commit_history(repo_link, author_name=None, start=None, end=None, path=None, username=None, password=None):
+def get_commit_history(repo_link, author_name=None, start=None, end=None, path=None, username=None, password=None, snapshot=None, backend=None):
     """
     Return the commit history of a specific author over a period of time
     API: https://api.github.com/repos/:owner/:repo/commits?author?since?until
@@ -227,6 +496,12 @@ def get_commit_history(repo_link, author_name=None, start=None, end=None, path=N
         path (str)              : filepath. if none provided then set to whole repository
         username (str)          : github username
         password (str)          : github password
+        snapshot                : (optional) RepoSnapshot shared with other extractors
+        backend (str)           : (optional) BACKEND_API, BACKEND_LOCAL or BACKEND_INDEX, defaults to
+                                  COMMIT_HISTORY_BACKEND. the local backend walks a mirror with git log: no
+                                  rate limit and no page cap, and author_name is matched against the author's
+                                  name and email. the index backend matches author_name exactly against the
+                                  login, name or email
 
     Returns:
         list:   commits in chronological order in specified range
@@ -244,58 +519,103 @@ def get_commit_history(repo_link, author_name=None, start=None, end=None, path=N
     else:
         end_date_formatted = "%s-%s-%sT%s:%s:%sZ" % (now.year, now.month, now.day, "23", "59", "59")
 
+    backend = backend or COMMIT_HISTORY_BACKEND
+    if backend == BACKEND_LOCAL:
+        return _get_commit_history_from_mirror(repo_link, author_name, start_date_formatted, end_date_formatted, path)
+    if backend == BACKEND_INDEX:
+        return _get_commit_history_from_index(repo_link, author_name, start_date_formatted, end_date_formatted, path)
+
+    query = dict(since = start_date_formatted, until = end_date_formatted)
+    if author_name:
+        query['author'] = author_name
+    if path:
+        query['path'] = path
+    # only keep the fields we report on
+    snapshot = _snapshot(repo_link, username, password, snapshot)
+    commit_history = snapshot.commits(('sha', 'commit.message', 'commit.committer.date'), **query)
 
-    owner, repo = process_repo_link(repo_link)
-    gh = github.GitHub(username=username, password=password) if username and password else GITHUB
-    if author_name and path:
-        commit_history = gh.repos(owner)(repo).commits.get(author = author_name, since = start_date_formatted, until = end_date_formatted, path = path ) 
-    elif not author_name and path: 
-        commit_history = gh.repos(owner)(repo).commits.get(since = start_date_formatted, until = end_date_formatted, path = path)
-    elif author_name and not path:
-        commit_history = gh.repos(owner)(repo).commits.get(author = author_name, since = start_date_formatted, until = end_date_formatted)
-    else:
-        commit_history = gh.repos(owner)(repo).commits.get(since = start_date_formatted, until = end_date_formatted)
-
-    n = len(commit_history)
     history = [] 
-    for i in range(n):
+    for entry in commit_history:
         commit = {}
-        commit['sha'] = commit_history[i]['sha']
-        commit['commit_message'] = commit_history[i]['commit']['message']
-        commit['timestamp'] = commit_history[i]['commit']['committer']['date']
+        commit['sha'] = entry['sha']
+        commit['commit_message'] = entry['commit']['message']
+        commit['timestamp'] = entry['commit']['committer']['date']
         history.append(commit)
     return history
 
-def _add_write_access(func, path, excinfo):
+def _get_commit_history_from_mirror(repo_link, author_name, since, until, path):
+    since = gitlog.parse_timestamp(since)
+    history = []
+    with _clone_repo(repo_link, since=since) as repo:
+        for entry in gitlog.iter_commits(repo, author=author_name, since=since, until=gitlog.parse_timestamp(until), path=path):
+            commit = {}
+            commit['sha'] = entry['sha']
+            commit['commit_message'] = entry['message']
+            commit['timestamp'] = gitlog.format_timestamp(entry['committer_time'])
+            history.append(commit)
+    return history
+
+def _get_commit_history_from_index(repo_link, author_name, since, until, path):
+    with _commit_index(repo_link) as index:
+        rows = index.commits(author_name, gitlog.parse_timestamp(since), gitlog.parse_timestamp(until), path)
+    history = []
+    for sha, login, name, subject, message, committer_time in rows:
+        commit = {}
+        commit['sha'] = sha
+        commit['commit_message'] = message
+        commit['timestamp'] = gitlog.format_timestamp(committer_time)
+        history.append(commit)
+    return history
+
+@contextlib.contextmanager
+def _commit_index(repo_link):
     """
-    Helper function to remove change read-only file status to editable
-    Source: http://stackoverflow.com/questions/1889597/deleting-directory-in-python
+    Helper context manager to get the commit index of a repo, updated with the commits
+    fetched into its mirror since it was last used. The mirror holding the index isn't
+    evicted before the with block exits
     """
-    os.chmod(path, stat.S_IWRITE)
-    func(path)
+    with MIRRORS.use(repo_link, strategy=mirrors.STRATEGY_FULL) as repo:
+        index = commit_index.CommitIndex.for_repo(repo)
+        index.update(repo)
+        yield index
 
-def _clone_repo(repo_link, destination=None):
+def _clone_repo(repo_link, since=None, paths=None):
     """
-    Helper function to clone a repo to destination. If folder already exists, delete all version
-    
+    Helper function to get a local copy of a repo. The repo is cloned once into
+    the mirror store and then kept up to date with incremental fetches; the clone
+    strategy is picked from what the query needs
+
     Args:
         repo_link:      owner/repo format
-        destination:    local file path, set to default if not supplied
+        since:          (optional) oldest commit date the query looks at
+        paths:          (optional) files whose contents the query reads
 
     Return:
-        reference to the cloned repo
+        context manager giving the bare mirror of the repo, leased until the with block exits
     """
-    if not destination:
-        destination = "%s%s" % ("./gitguard/", repo_link)
-    if os.path.exists(destination):
-        shutil.rmtree(destination, onerror=_add_write_access)
-    repo_url = "%s%s%s" % ("https://github.com/", repo_link, ".git");
-    
-    repo = Repo.clone_from(repo_url , destination, branch="master")
-    return repo
+    return MIRRORS.use(repo_link, since=since, paths=paths)
+
+def _iter_file_log(repo, file_path, *options):
+    """
+    Helper function to stream the commits touching a file
 
+    Return:
+        generator of (sha, author name, author email, title)
+    """
+    for line in gitlog.iter_lines(repo, 'log', '--format=%H%x09%an%x09%ae%x09%s', *(options + ('--', file_path))):
+        yield tuple(line.split('\t', 3))
 
-def get_commit_history_for_file(repo_link, file_path, author_name=None):
+def _author_matcher(author_name):
+    """
+    Helper function to match an author the way git log --author does, against "name <email>"
+    """
+    try:
+        pattern = re.compile(author_name)
+    except re.error:
+        pattern = re.compile(re.escape(author_name))
+    return lambda name, email: pattern.search('%s <%s>' % (name, email)) is not None
+
+def get_commit_history_for_file(repo_link, file_path, author_name=None, backend=None):
     """
     Return commit history for a file. Options: by author.
     
@@ -303,32 +623,54 @@ def get_commit_history_for_file(repo_link, file_path, author_name=None):
         repo_link:      owner/repo format
         file_path:      path to file in repo
         author_name:    (optional) limit history to one author
+        backend:        (optional) BACKEND_LOCAL or BACKEND_INDEX, defaults to FILE_HISTORY_BACKEND
 
     Return:
         list of commits in format [sha, author, title] if author's name no given
         OR
         list of commits in format [sha, title] if author's name is given
     """
-    repo = _clone_repo(repo_link)
-    if not author_name:
-        log = repo.git.log("--pretty=format:'%H\t%an\t%s'", file_path)
+    if (backend or FILE_HISTORY_BACKEND) == BACKEND_INDEX:
+        with _commit_index(repo_link) as index:
+            log = [(sha, name, subject) for sha, login, name, subject, message, committer_time
+                   in index.commits(author_name, path=file_path)]
     else:
-        author_parameter = "--author=%s" % (author_name)
-        log = repo.git.log("--pretty=format:'%H\t%an\t%s'", author_parameter, file_path)
-    log_split = log.splitlines()
+        options = ("--author=%s" % (author_name),) if author_name else ()
+        with _clone_repo(repo_link) as repo:
+            log = [(sha, author, title) for sha, author, email, title in _iter_file_log(repo, file_path, *options)]
     history = []
-    for line in log_split:
-        line = line.strip()
-        elements = re.split(r'\t+', line)
+    for sha, author, title in log:
         commit = {}
-        commit['sha'] = elements[0]
+        commit['sha'] = sha
         if not author_name:
-            commit['author'] = elements[1]
-        commit['commit_message'] = elements[2]
+            commit['author'] = author
+        commit['commit_message'] = title
         history.append(commit)
     return history
 
-def get_stats_by_author(repo_link, author_name, username=None, password=None):
+def get_stats_for_all_authors(repo_link, username=None, password=None, snapshot=None, backend=None):
+    """
+    Return total number of commits, lines added and lines deleted of every author,
+    from a single stats/contributors request
+
+    Args:
+        repo_link               : owner/repo format
+        username (str)          : github username
+        password (str)          : github password
+        snapshot                : (optional) RepoSnapshot shared with other extractors
+        backend (str)           : (optional) BACKEND_API or BACKEND_INDEX, defaults to STATS_BACKEND
+                                  the index only knows the username of authors committing with their
+                                  GitHub noreply email and keys the others by name
+
+    Return:
+        dict: author's username --> (commits, additions, deletions)
+    """
+    if (backend or STATS_BACKEND) == BACKEND_INDEX:
+        with _commit_index(repo_link) as index:
+            return index.stats_by_author()
+    return _snapshot(repo_link, username, password, snapshot).stats_by_author()
+
+def get_stats_by_author(repo_link, author_name, username=None, password=None, snapshot=None, backend=None):
     """
     Return total number of commits, lines added and lines delted by an author
     
@@ -337,23 +679,64 @@ def get_stats_by_author(repo_link, author_name, username=None, password=None):
         author_name             : limit history to one author
         username (str)          : github username
         password (str)          : github password
+        snapshot                : (optional) RepoSnapshot shared with other extractors
+        backend (str)           : (optional) BACKEND_API or BACKEND_INDEX, defaults to STATS_BACKEND
 
     Return:
         three numbers: commits, additions, deletions
+        None if the author has no statistics
+    """
+    if (backend or STATS_BACKEND) == BACKEND_INDEX:
+        return get_stats_for_all_authors(repo_link, username, password, snapshot, backend).get(author_name)
+    return _snapshot(repo_link, username, password, snapshot).contributor_matrix().author_totals(author_name)
+
+def _resolve_logins(repo_link, owners, gh):
+    """
+    Helper function to map commit emails to GitHub usernames: noreply emails carry the
+    username, the others are looked up once through one of their commits and remembered
     """
     owner, repo = process_repo_link(repo_link)
-    gh = github.GitHub(username=username, password=password) if username and password else GITHUB
-    repo_data = gh.repos(owner)(repo).stats.contributors.get();
-    for all_data in repo_data:
-        if all_data['author']['login'] == author_name:
-            total_commits = all_data['total']
-            weekly_data = all_data['weeks']
-            adds = 0
-            dels = 0
-            for week in weekly_data:
-                adds += week['a']
-                dels += week['d']
-            return total_commits, adds, dels
+    logins = {}
+    for email, (name, lines, sha) in owners.items():
+        login = commit_index.login_from_email(email)
+        if login is None:
+            try:
+                author = gh.repos(owner)(repo).commits(sha).get()['author']
+            except github.ApiNotFoundError:
+                author = None
+            login = author['login'] if author else None
+        logins[email] = login
+    return logins
+
+def get_lines_by_author(repo_link, username=None, password=None, snapshot=None):
+    """
+    Return the number of lines at HEAD last written by each author, from git blame
+    over every text file of the repo's mirror. Files unchanged since the last call
+    are not blamed again
+
+    Args:
+        repo_link               : owner/repo format
+        username (str)          : github username
+        password (str)          : github password
+        snapshot                : (optional) RepoSnapshot shared with other extractors
+
+    Return:
+        dict: author's username --> lines; authors without a GitHub account are keyed by name
+    """
+    with MIRRORS.use(repo_link, strategy=mirrors.STRATEGY_FULL) as repo:
+        ownership = blame.LineOwnership.for_repo(repo)
+        owners = ownership.compute(repo)
+        logins = ownership.logins()
+        unknown = dict((email, owner) for email, owner in owners.items() if email not in logins)
+        if unknown:
+            resolved = _resolve_logins(repo_link, unknown, _snapshot(repo_link, username, password, snapshot).gh)
+            ownership.save_logins(resolved)
+            logins.update(resolved)
+    lines = {}
+    for email, (name, count, sha) in owners.items():
+        author = logins.get(email) or name
+        lines[author] = lines.get(author, 0) + count
+    return lines
 
 def compare_history_in_files(repo_link, file_path, start_line, end_line, *authors):
     """
@@ -370,20 +753,32 @@ def compare_history_in_files(repo_link, file_path, start_line, end_line, *author
 
     Return:
         list of commits in format [author_name, stats] with stats being the result
-        of calling get_commit_history_for_file(repo_link, file_path, author)
+        of calling get_commit_history_for_file(repo_link, file_path, author), or with
+        a line range get_commit_history_for_file_with_lines, None if git can't follow the lines.
+        Without a line range a failing git log raises git.GitCommandError
     """
-    num_authors = len(authors)
     if start_line <= 0:
         start_line = 1
-    author_history = []
-    for author in authors:
-        history = {}
-        history['name'] = author
+    # one walk over the file for every author, partitioned as it streams
+    matchers = [_author_matcher(author) for author in authors]
+    author_history = [{'name': author, 'stats': []} for author in authors]
+    with _clone_repo(repo_link, paths=[file_path] if end_line > 0 else None) as repo:
         if end_line <= 0:
-            history['stats'] = get_commit_history_for_file(repo_link, file_path, author)
+            for sha, name, email, title in _iter_file_log(repo, file_path):
+                for matches, history in zip(matchers, author_history):
+                    if matches(name, email):
+                        history['stats'].append({'sha': sha, 'commit_message': title})
         else:
-            history['stats'] = get_commit_history_for_file_with_lines(repo_link, file_path, start_line, end_line, author)
-        author_history.append(history)
+            # like get_commit_history_for_file_with_lines, stats are None if git can't follow the lines
+            try:
+                for commit in gitlog.iter_line_log(repo, [(file_path, start_line, end_line)]):
+                    for matches, history in zip(matchers, author_history):
+                        if matches(commit['author_name'], commit['author_email']):
+                            history['stats'].append(commit)
+            except git.GitCommandError as e:
+                print(e)
+                for history in author_history:
+                    history['stats'] = None
     return author_history
 
 def get_commit_history_for_file_with_lines(repo_link, file_name, start, end, author_name):
@@ -400,18 +795,13 @@ def get_commit_history_for_file_with_lines(repo_link, file_name, start, end, aut
         author_name:    name of author
 
     Return:
-        list of commits by that author in those lines
+        list of commits by that author in those lines, each a dict with sha, author_name,
+        author_email, date and hunks (path, start and end of the lines as of that commit)
+        None if git can't follow the lines
     """
-    _clone_repo(repo_link)
-    command = 'git log --author="%s" -L %s,%s:%s | grep "commit [a-zA-Z0-9]"' % (author_name, start, end, file_name)
-    try:
-        result = subprocess.check_output(command, shell=True)
-        lines = result.splitlines()
-        history = []
-        for line in lines:
-            if line[0] == 'c':
-                history.append(line)
-        return history
-    except subprocess.CalledProcessError as e:
-        print(e)
+    with _clone_repo(repo_link, paths=[file_name]) as repo:
+        try:
+            return list(gitlog.iter_line_log(repo, [(file_name, start, end)], author=author_name))
+        except git.GitCommandError as e:
+            print(e)
     return
@@ -52,21 +52,57 @@ try:
     # Python 2
     from urllib2 import build_opener, HTTPSHandler, Request, HTTPError
     from urllib import quote as urlquote
+    from urlparse import urlsplit
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException
     from StringIO import StringIO
     def bytes(string, encoding=None):
         return str(string)
 except:
     # Python 3
     from urllib.request import build_opener, HTTPSHandler, HTTPError, Request
-    from urllib.parse import quote as urlquote
+    from urllib.parse import quote as urlquote, urlsplit
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException
     from io import StringIO
 
-import re, os, time, hmac, base64, hashlib, urllib, mimetypes, json
-from collections import Iterable
+import re, os, time, hmac, base64, hashlib, urllib, mimetypes, json, socket, threading, heapq, itertools, random, zlib
+from collections import OrderedDict
 from datetime import datetime, timedelta, tzinfo
 
 TIMEOUT=60
 
+# keep-alive connection pool defaults
+POOL_SIZE=4
+IDLE_TIMEOUT=30
+MAX_REDIRECTS=5
+# read size when decompressing response bodies
+CHUNK_SIZE=64 * 1024
+
+# page size used when following Link headers
+PER_PAGE=100
+
+# number of GET responses kept for conditional requests
+CACHE_SIZE=256
+
+# request priorities, lower runs first
+PRIORITY_INTERACTIVE=0
+PRIORITY_BACKGROUND=1
+# share of the hourly quota that background requests leave for interactive ones
+BACKGROUND_RESERVE=0.1
+# retries of a request rejected by a (secondary) rate limit
+RATE_LIMIT_RETRIES=2
+# wait when a secondary rate limit gives no Retry-After
+SECONDARY_RATE_LIMIT_WAIT=60
+
+# polling of statistics endpoints answering 202 Accepted
+STATS_POLL_DELAY=1
+STATS_POLL_MAX_DELAY=16
+STATS_POLL_DEADLINE=60
+
+HOOK_EVENTS = ('before_request', 'after_response', 'on_error')
+
+# upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
 _URL = 'https://api.github.com'
 _METHOD_MAP = dict(
         GET=lambda: 'GET',
@@ -75,6 +111,11 @@ _METHOD_MAP = dict(
         PATCH=lambda: 'PATCH',
         DELETE=lambda: 'DELETE')
 
+_USER_AGENT = 'githubpy/%s' % __version__
+
+# methods safe to resend when a reused connection fails
+_IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE')
+
 DEFAULT_SCOPE = None
 RW_SCOPE = 'user,public_repo,repo,repo:status,gist'
 
@@ -88,7 +129,7 @@ def _encode_params(kw):
             # Python 2
             qv = v.encode('utf-8') if isinstance(v, unicode) else str(v)
         except:
-            qv = v
+            qv = str(v)
         args.append('%s=%s' % (k, urlquote(qv)))
     return '&'.join(args)
 
@@ -106,23 +147,101 @@ def _encode_json(obj):
         return d
     return json.dumps(obj, default=_dump_obj)
 
-def _parse_json(jsonstr):
-    def _obj_hook(pairs):
-        o = JsonObject()
-        for k, v in pairs.items():
-            o[str(k)] = v
-        return o
-    return json.loads(jsonstr, object_hook=_obj_hook)
+def _parse_json(jsonstr, plain=False):
+    '''
+    Decode json into JsonObjects, or into plain dicts if plain is set.
+    Plain decoding skips the per-object hook and is considerably cheaper.
+    '''
+    if plain:
+        return json.loads(jsonstr)
+    return json.loads(jsonstr, object_hook=JsonObject)
+
+def as_json_object(obj):
+    '''
+    Convert plain decoded json into JsonObjects for attribute access.
+
+    >>> as_json_object([{'commit': {'message': 'm'}}])[0].commit.message
+    'm'
+    '''
+    if isinstance(obj, dict):
+        return JsonObject((k, as_json_object(v)) for k, v in obj.items())
+    if isinstance(obj, list):
+        return [as_json_object(v) for v in obj]
+    return obj
+
+def project(obj, fields):
+    '''
+    Keep only the given dotted fields of a decoded object, or of each element
+    of a list.
+
+    >>> project({'sha': 'a', 'commit': {'message': 'm', 'tree': {}}, 'parents': []}, ['sha', 'commit.message'])
+    {'sha': 'a', 'commit': {'message': 'm'}}
+    '''
+    if isinstance(obj, list):
+        return [project(o, fields) for o in obj]
+    result = dict()
+    for field in fields:
+        src, dst = obj, result
+        keys = field.split('.')
+        for key in keys[:-1]:
+            if not isinstance(src, dict) or key not in src:
+                src = None
+                break
+            src = src[key]
+            dst = dst.setdefault(key, dict())
+        if isinstance(src, dict) and keys[-1] in src:
+            dst[keys[-1]] = src[keys[-1]]
+    return result
+
+_LINK_RE = re.compile(r'<([^>]+)>\s*;\s*rel="([^"]+)"')
+
+def _parse_link_header(value):
+    '''
+    Parse a Link header into a dict of rel -> url.
+
+    >>> _parse_link_header('<https://api.github.com/x?page=2>; rel="next", <https://api.github.com/x?page=5>; rel="last"')['next']
+    'https://api.github.com/x?page=2'
+    '''
+    links = dict()
+    for url, rels in _LINK_RE.findall(value or ''):
+        for rel in rels.split():
+            links[rel] = url
+    return links
 
 class _Executable(object):
 
-    def __init__(self, _gh, _method, _path):
+    def __init__(self, _gh, _method, _path, _template=None, _fields=None):
         self._gh = _gh
         self._method = _method
         self._path = _path
+        self._template = _template or _path
+        self._fields = _fields
 
     def __call__(self, **kw):
-        return self._gh._http(self._method, self._path, **kw)
+        if self._method=='GET' and kw.pop('all_pages', False):
+            return list(self.iter(**kw))
+        r = self._gh._http(self._method, self._path, _template=self._template, **kw)
+        if self._fields and r is not None:
+            r = project(r, self._fields)
+        return r
+
+    def select(self, *fields):
+        '''
+        Return an executable whose results keep only the given dotted fields,
+        e.g. select('sha', 'commit.message').
+        '''
+        return _Executable(self._gh, self._method, self._path, self._template, fields)
+
+    def iter(self, prefetch=False, **kw):
+        '''
+        Lazily iterate over the items of every page, following the Link header.
+        per_page defaults to PER_PAGE. If prefetch is set the next page is fetched
+        in the background while the current one is consumed.
+        '''
+        items = self._gh._paginate(self._path, prefetch, _template=self._template, **kw)
+        if self._fields:
+            return (project(item, self._fields) for item in items)
+        return items
 
     def __str__(self):
         return '_Executable (%s %s)' % (self._method, self._path)
@@ -131,42 +250,353 @@ class _Executable(object):
 
 class _Callable(object):
 
-    def __init__(self, _gh, _name):
+    def __init__(self, _gh, _name, _template=None):
         self._gh = _gh
         self._name = _name
+        # path with call arguments replaced by *, e.g. /repos/*/*/commits
+        self._template = _template or _name
 
     def __call__(self, *args):
         if len(args)==0:
             return self
         name = '%s/%s' % (self._name, '/'.join([str(arg) for arg in args]))
-        return _Callable(self._gh, name)
+        template = '%s/%s' % (self._template, '/'.join(['*' for arg in args]))
+        return _Callable(self._gh, name, template)
 
     def __getattr__(self, attr):
         if attr=='get':
-            return _Executable(self._gh, 'GET', self._name)
+            return _Executable(self._gh, 'GET', self._name, self._template)
         if attr=='put':
-            return _Executable(self._gh, 'PUT', self._name)
+            return _Executable(self._gh, 'PUT', self._name, self._template)
         if attr=='post':
-            return _Executable(self._gh, 'POST', self._name)
+            return _Executable(self._gh, 'POST', self._name, self._template)
         if attr=='patch':
-            return _Executable(self._gh, 'PATCH', self._name)
+            return _Executable(self._gh, 'PATCH', self._name, self._template)
         if attr=='delete':
-            return _Executable(self._gh, 'DELETE', self._name)
+            return _Executable(self._gh, 'DELETE', self._name, self._template)
         name = '%s/%s' % (self._name, attr)
-        return _Callable(self._gh, name)
+        template = '%s/%s' % (self._template, attr)
+        return _Callable(self._gh, name, template)
 
     def __str__(self):
         return '_Callable (%s)' % self._name
 
     __repr__ = __str__
 
+def _read_body(response):
+    '''
+    Read a response body, decompressing gzip or deflate content incrementally.
+    Returns a tuple of (body, bytes read off the wire).
+    '''
+    encoding = (response.getheader('content-encoding') or '').strip().lower()
+    if encoding not in ('gzip', 'deflate'):
+        data = response.read()
+        return data, len(data)
+    d = zlib.decompressobj(16 + zlib.MAX_WBITS if encoding=='gzip' else zlib.MAX_WBITS)
+    chunks = []
+    wire_bytes = 0
+    while True:
+        chunk = response.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        try:
+            chunks.append(d.decompress(chunk))
+        except zlib.error:
+            # some servers send raw deflate without the zlib header
+            if encoding!='deflate' or wire_bytes:
+                raise
+            d = zlib.decompressobj(-zlib.MAX_WBITS)
+            chunks.append(d.decompress(chunk))
+        wire_bytes += len(chunk)
+    chunks.append(d.flush())
+    return b''.join(chunks), wire_bytes
+
+class ConnectionPool(object):
+
+    '''
+    Pool of persistent HTTP(S) connections keyed by scheme, host and credential.
+
+    Up to pool_size idle connections are kept per key and dropped once they
+    have been idle for idle_timeout seconds. A request that fails on a reused
+    connection (typically one the server has already closed) is retried on a
+    fresh connection, unless the method isn't idempotent or the response
+    timed out: the server may then have acted on the request already.
+    '''
+
+    def __init__(self, pool_size=POOL_SIZE, idle_timeout=IDLE_TIMEOUT, timeout=TIMEOUT):
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle = dict()
+        self._lock = threading.Lock()
+
+    def _connect(self, scheme, netloc):
+        if scheme=='https':
+            return HTTPSConnection(netloc, timeout=self.timeout)
+        return HTTPConnection(netloc, timeout=self.timeout)
+
+    def _acquire(self, key):
+        now = time.time()
+        stale = []
+        conn = None
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                c, last_used = idle.pop()
+                if now - last_used < self.idle_timeout:
+                    conn = c
+                    break
+                stale.append(c)
+        for c in stale:
+            c.close()
+        if conn:
+            return conn, True
+        return self._connect(key[0], key[1]), False
+
+    def _release(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.pool_size:
+                idle.append((conn, time.time()))
+                return
+        conn.close()
+
+    def urlopen(self, method, url, body=None, headers=None, credential=None):
+        '''
+        Send a request over a pooled connection.
+
+        Returns a JsonObject with status, headers (a dict with lower-cased
+        names), body (the decoded response bytes) and wire_bytes (the bytes
+        read off the connection, before any gzip/deflate decoding).
+        '''
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path = '%s?%s' % (path, parts.query)
+        key = (parts.scheme, parts.netloc, credential)
+        while True:
+            conn, reused = self._acquire(key)
+            try:
+                conn.request(method, path, body, headers or {})
+                response = conn.getresponse()
+                data, wire_bytes = _read_body(response)
+            except (HTTPException, socket.error) as e:
+                conn.close()
+                if reused and method in _IDEMPOTENT_METHODS and not isinstance(e, socket.timeout):
+                    continue
+                raise
+            resp_headers = dict((k.lower(), v) for k, v in response.getheaders())
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(key, conn)
+            return JsonObject(status=response.status, headers=resp_headers, body=data, wire_bytes=wire_bytes)
+
+    def clear(self):
+        '''
+        Close all idle connections.
+        '''
+        with self._lock:
+            idle, self._idle = self._idle, dict()
+        for conns in idle.values():
+            for conn, _ in conns:
+                conn.close()
+
+class ResponseCache(object):
+
+    '''
+    LRU cache of GET responses for conditional requests.
+
+    Entries are keyed by method, url and credential and hold the ETag and
+    Last-Modified validators alongside the response headers and body, so a
+    304 Not Modified can be answered locally.
+    '''
+
+    def __init__(self, max_entries=CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        '''
+        Return the cached (headers, body) for key, or None.
+        '''
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self._entries[key] = entry
+            return entry
+
+    def put(self, key, headers, body):
+        if not ('etag' in headers or 'last-modified' in headers):
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (headers, body)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class RateLimitScheduler(object):
+
+    '''
+    Paces requests of one credential against its x-ratelimit-* quota.
+
+    Requests queue by priority and are admitted while the remaining quota,
+    less the requests already in flight, allows; background requests leave
+    BACKGROUND_RESERVE of the limit to interactive ones. Once the quota is
+    spent, or a Retry-After or secondary rate limit is hit, requests are held
+    until the reset time. If max_wait is set, a request that would wait longer
+    raises ApiRateLimitError instead so callers can shed load.
+    '''
+
+    def __init__(self, background_reserve=BACKGROUND_RESERVE, max_wait=None):
+        self.background_reserve = background_reserve
+        self.max_wait = max_wait
+        self.remaining = (-1)
+        self.limit = (-1)
+        self.reset = (-1)
+        self.blocked_until = 0
+        self._in_flight = 0
+        self._waiting = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    @property
+    def queue_depth(self):
+        return len(self._waiting)
+
+    def status(self):
+        '''
+        Current quota and queue as a dict.
+        '''
+        with self._cond:
+            return dict(remaining=self.remaining, limit=self.limit, reset=self.reset,
+                        blocked_until=self.blocked_until, in_flight=self._in_flight,
+                        queue_depth=len(self._waiting))
+
+    def _admissible(self, priority, now):
+        if now < self.blocked_until:
+            return False
+        if self.remaining < 0 or (0 <= self.reset <= now):
+            return True
+        budget = self.remaining - self._in_flight
+        if priority > PRIORITY_INTERACTIVE:
+            budget -= int(self.limit * self.background_reserve)
+        return budget > 0
+
+    def _wake_time(self, now):
+        times = [t for t in (self.blocked_until, self.reset) if t > now]
+        return min(times) if times else None
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE):
+        '''
+        Block until a request of the given priority may be sent.
+        '''
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+            deadline = None if self.max_wait is None else time.time() + self.max_wait
+            try:
+                while True:
+                    now = time.time()
+                    if self._waiting[0]==ticket and self._admissible(priority, now):
+                        break
+                    wake = self._wake_time(now)
+                    if deadline is not None:
+                        if now >= deadline or (wake is not None and wake > deadline and self._in_flight==0):
+                            raise ApiRateLimitError('rate limited until %s' % int(wake or now))
+                        wake = deadline if wake is None else min(wake, deadline)
+                    self._cond.wait(None if wake is None else wake - now)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+            self._in_flight += 1
+
+    def release(self, status=None, headers=None, body=None):
+        '''
+        Record the outcome of an admitted request. Returns True if it was
+        rejected by a rate limit and should be retried.
+        '''
+        with self._cond:
+            self._in_flight -= 1
+            limited = False
+            if headers:
+                now = time.time()
+                if 'x-ratelimit-remaining' in headers:
+                    self.remaining = int(headers['x-ratelimit-remaining'])
+                if 'x-ratelimit-limit' in headers:
+                    self.limit = int(headers['x-ratelimit-limit'])
+                if 'x-ratelimit-reset' in headers:
+                    self.reset = int(headers['x-ratelimit-reset'])
+                if status in (403, 429):
+                    if 'retry-after' in headers:
+                        self.blocked_until = max(self.blocked_until, now + int(headers['retry-after']))
+                        limited = True
+                    elif self.remaining==0:
+                        self.blocked_until = max(self.blocked_until, self.reset)
+                        limited = True
+                    elif body and b'secondary rate limit' in body.lower():
+                        self.blocked_until = max(self.blocked_until, now + SECONDARY_RATE_LIMIT_WAIT)
+                        limited = True
+            self._cond.notify_all()
+            return limited
+
+class _SingleFlight(object):
+
+    '''
+    Runs at most one call per key at a time. Callers arriving while a call is
+    in flight wait for it and share its result or exception.
+    '''
+
+    def __init__(self):
+        self._calls = dict()
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        '''
+        Returns a tuple of (result, shared) where shared is True if the result
+        came from another caller's call.
+        '''
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = JsonObject(event=threading.Event(), result=None, error=None)
+        if not leader:
+            call.event.wait()
+            if call.error:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
+
+# in-flight GETs, shared by every client so identical concurrent requests
+# of one credential go upstream once
+_IN_FLIGHT_GETS = _SingleFlight()
+
 class GitHub(object):
 
     '''
     GitHub client.
     '''
 
-    def __init__(self, username=None, password=None, access_token=None, client_id=None, client_secret=None, redirect_uri=None, scope=None):
+    def __init__(self, username=None, password=None, access_token=None, client_id=None, client_secret=None, redirect_uri=None, scope=None, pool_size=POOL_SIZE, idle_timeout=IDLE_TIMEOUT, pool=None, cache=None, scheduler=None, priority=PRIORITY_INTERACTIVE, plain_json=False, hooks=None, api_url=None):
         self.x_ratelimit_remaining = (-1)
         self.x_ratelimit_limit = (-1)
         self.x_ratelimit_reset = (-1)
@@ -182,6 +612,20 @@ class GitHub(object):
         self._client_secret = client_secret
         self._redirect_uri = redirect_uri
         self._scope = scope
+        self._pool = pool or ConnectionPool(pool_size, idle_timeout)
+        # pass cache=False to disable conditional requests
+        self._cache = ResponseCache() if cache is None else cache
+        # share one scheduler between clients of the same credential
+        self._scheduler = scheduler or RateLimitScheduler()
+        self._priority = priority
+        # decode responses into plain dicts rather than JsonObjects
+        self._plain_json = plain_json
+        self._lock = threading.Lock()
+        self._transfer = JsonObject(requests=0, coalesced=0, wire_bytes=0, body_bytes=0, last=None)
+        # event -> list of callables; pass the same dict to share hooks between clients
+        self._hooks = dict() if hooks is None else hooks
+        # e.g. a local stand-in server, see github_replay
+        self._api_url = (api_url or _URL).rstrip('/')
 
     def authorize_url(self, state=None):
         '''
@@ -228,37 +672,226 @@ class GitHub(object):
     def __getattr__(self, attr):
         return _Callable(self, '/%s' % attr)
 
-    def _http(self, _method, _path, **kw):
+    def _http(self, _method, _path, _template=None, **kw):
         data = None
-        params = None
         if _method=='GET' and kw:
             _path = '%s?%s' % (_path, _encode_params(kw))
         if _method in ['POST', 'PATCH', 'PUT']:
             data = bytes(_encode_json(kw), 'utf-8')
-        url = '%s%s' % (_URL, _path)
-        opener = build_opener(HTTPSHandler)
-        request = Request(url, data=data)
-        request.get_method = _METHOD_MAP[_method]
+        url = '%s%s' % (self._api_url, _path)
+        return self._request(_method, url, data, _template)[0]
+
+    def add_hook(self, event, fn):
+        '''
+        Register fn(info) for one of HOOK_EVENTS. info is a JsonObject with
+        method, path (template such as /repos/*/*/commits) and url; after a
+        response it also has status, latency, wire_bytes, body_bytes (0 when
+        coalesced), cache ('hit', 'miss' or None), coalesced (shared another
+        caller's in-flight GET) and ratelimit_remaining/ratelimit_limit, and
+        on_error adds error.
+        '''
+        if event not in HOOK_EVENTS:
+            raise ValueError('unknown hook event: %s' % event)
+        self._hooks.setdefault(event, []).append(fn)
+
+    def remove_hook(self, event, fn):
+        self._hooks.get(event, []).remove(fn)
+
+    def _fire(self, event, info):
+        for fn in list(self._hooks.get(event, ())):
+            fn(info)
+
+    def _request(self, _method, url, data=None, _template=None):
+        '''
+        Send a request to an absolute url. Returns a tuple of (json, headers).
+        '''
+        info = JsonObject(method=_method, path=_template or urlsplit(url).path, url=url)
+        self._fire('before_request', info)
+        start = time.time()
+        try:
+            result = self._do_request(_method, url, data, info)
+        except Exception as e:
+            info.latency = time.time() - start
+            info.error = e
+            self._fire('on_error', info)
+            raise
+        info.latency = time.time() - start
+        self._fire('after_response', info)
+        return result
+
+    def _do_request(self, _method, url, data, info):
+        headers = {'User-Agent': _USER_AGENT, 'Accept-Encoding': 'gzip, deflate'}
         if self._authorization:
-            request.add_header('Authorization', self._authorization)
+            headers['Authorization'] = self._authorization
         if _method in ['POST', 'PATCH', 'PUT']:
-            request.add_header('Content-Type', 'application/x-www-form-urlencoded')
-        try:
-            response = opener.open(request, timeout=TIMEOUT)
-            is_json = self._process_resp(response.headers)
-            if is_json:
-                return _parse_json(response.read().decode('utf-8'))
-        except HTTPError as e:
-            is_json = self._process_resp(e.headers)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        cache_key = cached = None
+        if _method=='GET' and self._cache:
+            cache_key = (_method, url, self._authorization)
+            cached = self._cache.get(cache_key)
+            if cached:
+                if 'etag' in cached[0]:
+                    headers['If-None-Match'] = cached[0]['etag']
+                if 'last-modified' in cached[0]:
+                    headers['If-Modified-Since'] = cached[0]['last-modified']
+        shared = False
+        if _method=='GET':
+            # validators are part of the key so a shared 304 matches our cache
+            key = (url, self._authorization, headers.get('If-None-Match'), headers.get('If-Modified-Since'))
+            if '/stats/' in url:
+                # GitHub answers 202 while it computes statistics
+                r, shared = _IN_FLIGHT_GETS.do(key, lambda: self._poll_stats(url, headers))
+            else:
+                r, shared = _IN_FLIGHT_GETS.do(key, lambda: self._send(_method, url, data, headers))
+        else:
+            r = self._send(_method, url, data, headers)
+        status, resp_headers, body = r.status, r.headers, r.body
+        info.coalesced = shared
+        info.status = status
+        # the bytes of a shared response were transferred once, for the leader
+        info.wire_bytes = 0 if shared else r.wire_bytes
+        info.body_bytes = 0 if shared else len(body)
+        info.cache = None
+        info.ratelimit_remaining = int(resp_headers.get('x-ratelimit-remaining', -1))
+        info.ratelimit_limit = int(resp_headers.get('x-ratelimit-limit', -1))
+        with self._lock:
+            if shared:
+                self._transfer.coalesced += 1
+            else:
+                self._transfer.requests += 1
+                self._transfer.wire_bytes += r.wire_bytes
+                self._transfer.body_bytes += len(body)
+            self._transfer.last = JsonObject(url=url, wire_bytes=r.wire_bytes, body_bytes=len(body))
+        if cache_key:
+            if status==304 and cached:
+                # 304s are not counted against the rate limit
+                self._cache.hits += 1
+                info.cache = 'hit'
+                merged = dict(cached[0])
+                merged.update(resp_headers)
+                status, resp_headers, body = 200, merged, cached[1]
+            else:
+                self._cache.misses += 1
+                info.cache = 'miss'
+                if status==200:
+                    self._cache.put(cache_key, resp_headers, body)
+        is_json = self._process_resp(resp_headers)
+        if status >= 400:
             if is_json:
-                json = _parse_json(e.read().decode('utf-8'))
+                json = _parse_json(body.decode('utf-8'))
             else:
-                json = e.read().decode('utf-8')
+                json = body.decode('utf-8')
             req = JsonObject(method=_method, url=url)
-            resp = JsonObject(code=e.code, json=json)
+            resp = JsonObject(code=status, json=json)
             if resp.code==404:
                 raise ApiNotFoundError(url, req, resp)
+            if r.limited:
+                raise ApiRateLimitError(url, req, resp)
             raise ApiError(url, req, resp)
+        if is_json and body:
+            return _parse_json(body.decode('utf-8'), self._plain_json), resp_headers
+        return None, resp_headers
+
+    def _send(self, _method, url, data, headers):
+        '''
+        Send a request once admitted by the scheduler, retrying rate limited ones.
+        Returns the response of ConnectionPool.urlopen with limited set.
+        '''
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            self._scheduler.acquire(self._priority)
+            try:
+                r = self._urlopen(_method, url, data, headers)
+            except:
+                self._scheduler.release()
+                raise
+            r.limited = self._scheduler.release(r.status, r.headers, r.body)
+            if not r.limited:
+                break
+        return r
+
+    def _poll_stats(self, url, headers):
+        '''
+        GET a statistics endpoint, polling with jittered exponential backoff
+        while it answers 202 Accepted.
+        '''
+        deadline = time.time() + STATS_POLL_DEADLINE
+        delay = STATS_POLL_DELAY
+        while True:
+            r = self._send('GET', url, None, headers)
+            if r.status!=202:
+                return r
+            now = time.time()
+            if now >= deadline:
+                raise ApiStatsPendingError(url, JsonObject(method='GET', url=url), JsonObject(code=202, json=None))
+            time.sleep(min(delay / 2.0 + random.uniform(0, delay / 2.0), deadline - now))
+            delay = min(delay * 2, STATS_POLL_MAX_DELAY)
+
+    def _paginate(self, _path, prefetch=False, _template=None, **kw):
+        kw.setdefault('per_page', PER_PAGE)
+        url = '%s%s?%s' % (self._api_url, _path, _encode_params(kw))
+        pages = self._prefetched_pages(url, _template) if prefetch else self._pages(url, _template)
+        for page in pages:
+            if isinstance(page, list):
+                for item in page:
+                    yield item
+            elif page is not None:
+                yield page
+
+    def _pages(self, url, _template=None):
+        while url:
+            page, headers = self._request('GET', url, None, _template)
+            yield page
+            url = _parse_link_header(headers.get('link')).get('next')
+
+    def _prefetched_pages(self, url, _template=None):
+        def _fetch(next_url, result):
+            try:
+                result['page'] = self._request('GET', next_url, None, _template)
+            except Exception as e:
+                result['error'] = e
+        page, headers = self._request('GET', url, None, _template)
+        while True:
+            url = _parse_link_header(headers.get('link')).get('next')
+            if url:
+                result = dict()
+                t = threading.Thread(target=_fetch, args=(url, result))
+                t.daemon = True
+                t.start()
+            yield page
+            if not url:
+                return
+            t.join()
+            if 'error' in result:
+                raise result['error']
+            page, headers = result['page']
+
+    def _urlopen(self, method, url, data, headers):
+        '''
+        Issue a request through the connection pool, following redirects.
+        '''
+        for i in range(MAX_REDIRECTS + 1):
+            r = self._pool.urlopen(method, url, data, headers, self._authorization)
+            if r.status not in (301, 302, 307, 308) or 'location' not in r.headers:
+                break
+            url = r.headers['location']
+            if r.status in (301, 302) and method!='GET':
+                method, data = 'GET', None
+        return r
+
+    def transfer_stats(self):
+        '''
+        Number of requests and bytes received on the wire vs after
+        decompression, in total and for the last request. Requests answered
+        by another caller's identical in-flight GET count as coalesced.
+        '''
+        with self._lock:
+            return dict(self._transfer)
+
+    def rate_limit_status(self):
+        '''
+        Remaining quota and number of queued requests, for shedding load.
+        '''
+        return self._scheduler.status()
 
     def _process_resp(self, headers):
         is_json = False
@@ -275,6 +908,110 @@ class GitHub(object):
                     is_json = headers[k].startswith('application/json')
         return is_json
 
+class MetricsCollector(object):
+
+    '''
+    Per-endpoint call counts and latency histograms fed by client hooks.
+
+    >>> m = MetricsCollector()
+    >>> m.after_response(JsonObject(method='GET', path='/repos/*/*', status=200, latency=0.2, wire_bytes=10, body_bytes=40, cache='hit', ratelimit_remaining=59))
+    >>> m.snapshot()['GET /repos/*/*']['calls']
+    1
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = dict()
+
+    def install(self, gh):
+        gh.add_hook('after_response', self.after_response)
+        gh.add_hook('on_error', self.on_error)
+        return self
+
+    def _endpoint(self, info):
+        key = '%s %s' % (info.method, info.path)
+        e = self._endpoints.get(key)
+        if e is None:
+            e = self._endpoints[key] = dict(calls=0, errors=0, cache_hits=0, coalesced=0, statuses=dict(),
+                                            wire_bytes=0, body_bytes=0, latency_sum=0.0, latency_max=0.0,
+                                            buckets=[0] * (len(LATENCY_BUCKETS) + 1), ratelimit_remaining=(-1))
+        return e
+
+    def _record(self, e, info):
+        e['calls'] += 1
+        latency = info.get('latency', 0.0)
+        e['latency_sum'] += latency
+        e['latency_max'] = max(e['latency_max'], latency)
+        i = 0
+        while i < len(LATENCY_BUCKETS) and latency > LATENCY_BUCKETS[i]:
+            i += 1
+        e['buckets'][i] += 1
+        status = info.get('status')
+        if status is not None:
+            e['statuses'][str(status)] = e['statuses'].get(str(status), 0) + 1
+        e['wire_bytes'] += info.get('wire_bytes', 0)
+        e['body_bytes'] += info.get('body_bytes', 0)
+        if info.get('cache')=='hit':
+            e['cache_hits'] += 1
+        if info.get('coalesced'):
+            e['coalesced'] += 1
+        if info.get('ratelimit_remaining', -1) >= 0:
+            e['ratelimit_remaining'] = info.ratelimit_remaining
+
+    def after_response(self, info):
+        with self._lock:
+            self._record(self._endpoint(info), info)
+
+    def on_error(self, info):
+        with self._lock:
+            e = self._endpoint(info)
+            self._record(e, info)
+            e['errors'] += 1
+
+    def _quantile(self, e, q):
+        # upper bound of the bucket holding the q-th quantile
+        rank = q * e['calls']
+        seen = 0
+        for i, n in enumerate(e['buckets']):
+            seen += n
+            if n and seen >= rank:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else e['latency_max']
+        return 0.0
+
+    def snapshot(self):
+        '''
+        Metrics per endpoint ("METHOD /path/template") as a dict.
+        '''
+        with self._lock:
+            result = dict()
+            for key, e in self._endpoints.items():
+                d = dict(e, statuses=dict(e['statuses']), buckets=list(e['buckets']))
+                d['latency_mean'] = e['latency_sum'] / e['calls'] if e['calls'] else 0.0
+                d['latency_p50'] = self._quantile(e, 0.5)
+                d['latency_p99'] = self._quantile(e, 0.99)
+                result[key] = d
+            return result
+
+    def total_calls(self):
+        with self._lock:
+            return sum(e['calls'] for e in self._endpoints.values())
+
+    def to_json(self):
+        return json.dumps(dict(buckets=list(LATENCY_BUCKETS), endpoints=self.snapshot()), indent=2, sort_keys=True)
+
+    def to_text(self):
+        snapshot = self.snapshot()
+        lines = ['%-50s %6s %6s %6s %9s %9s %9s %12s' % ('endpoint', 'calls', 'errors', 'hits', 'mean(s)', 'p50(s)', 'p99(s)', 'wire bytes')]
+        for key in sorted(snapshot, key=lambda k: -snapshot[k]['latency_sum']):
+            d = snapshot[key]
+            lines.append('%-50s %6d %6d %6d %9.3f %9.3f %9.3f %12d' % (key, d['calls'], d['errors'], d['cache_hits'],
+                         d['latency_mean'], d['latency_p50'], d['latency_p99'], d['wire_bytes']))
+        return '\n'.join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
 class JsonObject(dict):
     '''
     general json object that can bind any fields but also act as a dict.
@@ -303,6 +1040,17 @@ class ApiAuthError(ApiError):
 class ApiNotFoundError(ApiError):
     pass
 
+class ApiStatsPendingError(ApiError):
+    '''
+    Statistics were still being computed when the poll deadline passed.
+    '''
+    pass
+
+class ApiRateLimitError(ApiError):
+
+    def __init__(self, url, request=None, response=None):
+        super(ApiRateLimitError, self).__init__(url, request, response)
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
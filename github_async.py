@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*-coding: utf8 -*-
+
+'''
+asyncio front-end for the GitHub API Python SDK. (Python >= 3.6)
+
+Requests keep the attribute-chaining API of github.GitHub but are awaitable.
+They run on a bounded thread pool over the wrapped client, so they share its
+connection pool, response cache and rate-limit scheduler.
+
+Usage:
+
+>>> async def followers_and_following(gh):
+...     return await asyncio.gather(
+...         gh.users('githubpy').followers.get(),
+...         gh.users('githubpy').following.get())
+>>> gh = AsyncGitHub(username='githubpy', password='test-githubpy-1234')
+>>> L1, L2 = asyncio.get_event_loop().run_until_complete(followers_and_following(gh))
+>>> L1[0].login == u'michaelliao'
+True
+'''
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import github
+
+CONCURRENCY=8
+
+_DONE = object()
+
+class _AsyncExecutable(object):
+
+    def __init__(self, _gh, _method, _path, _template=None):
+        self._gh = _gh
+        self._method = _method
+        self._path = _path
+        self._template = _template or _path
+
+    async def __call__(self, **kw):
+        executable = github._Executable(self._gh._github, self._method, self._path, self._template)
+        return await self._gh._run(executable, **kw)
+
+    async def iter(self, **kw):
+        '''
+        Asynchronously iterate over the items of every page, following the
+        Link header. Each page is fetched only when the previous one is used up.
+        '''
+        kw.setdefault('per_page', github.PER_PAGE)
+        url = '%s%s?%s' % (self._gh._github._api_url, self._path, github._encode_params(kw))
+        pages = self._gh._github._pages(url, self._template)
+        while True:
+            page = await self._gh._run(next, pages, _DONE)
+            if page is _DONE:
+                return
+            if isinstance(page, list):
+                for item in page:
+                    yield item
+            elif page is not None:
+                yield page
+
+    def __str__(self):
+        return '_AsyncExecutable (%s %s)' % (self._method, self._path)
+
+    __repr__ = __str__
+
+class _AsyncCallable(object):
+
+    def __init__(self, _gh, _name, _template=None):
+        self._gh = _gh
+        self._name = _name
+        self._template = _template or _name
+
+    def __call__(self, *args):
+        if len(args)==0:
+            return self
+        name = '%s/%s' % (self._name, '/'.join([str(arg) for arg in args]))
+        template = '%s/%s' % (self._template, '/'.join(['*' for arg in args]))
+        return _AsyncCallable(self._gh, name, template)
+
+    def __getattr__(self, attr):
+        if attr in ('get', 'put', 'post', 'patch', 'delete'):
+            return _AsyncExecutable(self._gh, attr.upper(), self._name, self._template)
+        name = '%s/%s' % (self._name, attr)
+        template = '%s/%s' % (self._template, attr)
+        return _AsyncCallable(self._gh, name, template)
+
+    def __str__(self):
+        return '_AsyncCallable (%s)' % self._name
+
+    __repr__ = __str__
+
+class AsyncGitHub(object):
+
+    '''
+    asyncio GitHub client.
+
+    Takes the keyword arguments of github.GitHub, or an existing client as
+    client=, and runs at most concurrency requests at once.
+    '''
+
+    def __init__(self, client=None, concurrency=CONCURRENCY, **kw):
+        if client is None:
+            kw.setdefault('pool_size', concurrency)
+            client = github.GitHub(**kw)
+        self._github = client
+        self._concurrency = concurrency
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._semaphore = None
+
+    async def _run(self, fn, *args, **kw):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        async with self._semaphore:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kw))
+
+    def rate_limit_status(self):
+        return self._github.rate_limit_status()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def __getattr__(self, attr):
+        return _AsyncCallable(self, '/%s' % attr)
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
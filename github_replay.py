@@ -0,0 +1,519 @@
+#!/usr/bin/env python
+# -*-coding: utf8 -*-
+
+'''
+Record/replay stand-in for the GitHub API.
+
+Responses recorded from api.github.com are kept in a Cassette (a JSON file)
+and served back by StandInServer, a local HTTP server which can also fake
+whole repositories (SyntheticRepo) and inject latency. Point a client at it
+with GitHub(api_url=server.url), or gitguard.set_api_url(server.url).
+Synthetic repositories can also be written out as git repositories
+(write_git_remotes) for the extractors that read a local mirror.
+
+Recording:
+
+>>> cassette = Cassette()
+>>> gh = github.GitHub(pool=RecordingPool(cassette))
+>>> L = gh.repos('githubpy')('testgithubpy').issues.get(all_pages=True)
+>>> cassette.save('issues.json')
+
+Replaying:
+
+>>> server = StandInServer(Cassette.load('issues.json'), latency=0.05).start()
+>>> gh = github.GitHub(api_url=server.url)
+>>> L[0].title == gh.repos('githubpy')('testgithubpy').issues.get()[0].title
+True
+>>> server.stop()
+
+Serving from the command line:
+
+    python github_replay.py [cassette.json] [--latency SECONDS] [--port PORT] [--synthetic small,medium,huge]
+'''
+
+try:
+    # Python 2
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlsplit, parse_qsl
+except ImportError:
+    # Python 3
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlsplit, parse_qsl
+
+import bisect, calendar, gzip, hashlib, io, json, os, random, re, socket, subprocess, sys, threading, time
+
+import github
+
+# headers that describe the encoding on the wire rather than the body we keep
+_HOP_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding', 'connection', 'keep-alive')
+
+_BASE_RE = re.compile(r'<https?://[^/>]+')
+
+WEEK = 7 * 24 * 3600
+
+def _normalize(path):
+    parts = urlsplit(path)
+    query = '&'.join('%s=%s' % kv for kv in sorted(parse_qsl(parts.query)))
+    return '%s?%s' % (parts.path, query) if query else parts.path
+
+class Cassette(object):
+
+    '''
+    Recorded interactions, replayed in order per method and path.
+    '''
+
+    def __init__(self, interactions=None):
+        self.interactions = interactions or []
+        self._lock = threading.Lock()
+        self._played = dict()
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as f:
+            return cls(json.load(f))
+
+    def save(self, filename):
+        with self._lock:
+            with open(filename, 'w') as f:
+                json.dump(self.interactions, f, indent=1, sort_keys=True)
+
+    def record(self, method, url, status, headers, body):
+        parts = urlsplit(url)
+        path = '%s?%s' % (parts.path, parts.query) if parts.query else parts.path
+        headers = dict((k, v) for k, v in headers.items() if k not in _HOP_HEADERS)
+        if 'link' in headers:
+            # keep links relative so they can be served from any base url
+            headers['link'] = _BASE_RE.sub('<', headers['link'])
+        with self._lock:
+            self.interactions.append(dict(method=method, path=path, status=status, headers=headers,
+                                          body=body.decode('utf-8')))
+
+    def play(self, method, path):
+        '''
+        Return the next recorded interaction for method and path, repeating the
+        last one once they are used up, or None.
+        '''
+        key = (method, _normalize(path))
+        with self._lock:
+            matches = [i for i in self.interactions if (i['method'], _normalize(i['path']))==key]
+            if not matches:
+                return None
+            n = self._played.get(key, 0)
+            self._played[key] = n + 1
+            return matches[min(n, len(matches) - 1)]
+
+class RecordingPool(github.ConnectionPool):
+
+    '''
+    Connection pool that records every response into a cassette.
+    304 responses are skipped since they are only meaningful to the cache
+    that sent the request.
+    '''
+
+    def __init__(self, cassette, **kw):
+        super(RecordingPool, self).__init__(**kw)
+        self.cassette = cassette
+
+    def urlopen(self, method, url, body=None, headers=None, credential=None):
+        r = super(RecordingPool, self).urlopen(method, url, body, headers, credential)
+        if r.status!=304:
+            self.cassette.record(method, url, r.status, r.headers, r.body)
+        return r
+
+def _iso(ts):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(ts))
+
+def _parse_iso(value):
+    return calendar.timegm(time.strptime(value, '%Y-%m-%dT%H:%M:%SZ'))
+
+class SyntheticRepo(object):
+
+    '''
+    Deterministic fake repository answering the endpoints gitguard uses:
+    the repo itself, contributors, commits (filtered by author/since/until),
+    stats/contributors, stats/code_frequency and users of its contributors.
+    Statistics endpoints answer 202 for their first stats_pending requests.
+    Once written with write_git, commits/:sha answers for the git commits.
+    '''
+
+    SIZES = dict(
+        small=dict(contributors=5, commits=200, weeks=26),
+        medium=dict(contributors=50, commits=5000, weeks=156),
+        huge=dict(contributors=500, commits=100000, weeks=520))
+
+    def __init__(self, owner, name, contributors=5, commits=200, weeks=52, stats_pending=1, seed=0):
+        self.owner = owner
+        self.name = name
+        self.stats_pending = stats_pending
+        self.logins = ['%s-dev%d' % (name, i) for i in range(contributors)]
+        rnd = random.Random(seed)
+        # newest commit is just before now, the oldest weeks ago
+        self.end = int(time.time())
+        self.step = weeks * WEEK // commits or 1
+        self._authors = [min(int(rnd.paretovariate(1.0)) - 1, contributors - 1) for i in range(commits)]
+        self._changes = [(rnd.randint(0, 200), rnd.randint(0, 100)) for i in range(commits)]
+        self._by_author = dict()
+        for i, a in enumerate(self._authors):
+            self._by_author.setdefault(a, []).append(i)
+        self._pending = dict()
+        self._stats = None
+        # sha of a commit of write_git --> its index
+        self._git_shas = dict()
+
+    @classmethod
+    def of_size(cls, owner, name, size, **kw):
+        args = dict(cls.SIZES[size])
+        args.update(kw)
+        return cls(owner, name, **args)
+
+    @property
+    def full_name(self):
+        return '%s/%s' % (self.owner, self.name)
+
+    def _time(self, i):
+        return self.end - (i + 1) * self.step
+
+    def _week(self, ts):
+        # GitHub weeks start on Sunday 00:00 UTC; the epoch was a Thursday
+        return ts - (ts - 3 * 24 * 3600) % WEEK
+
+    def _user(self, a):
+        login = self.logins[a]
+        return dict(login=login, id=a + 1, type='User', site_admin=False,
+                    url='/users/%s' % login, html_url='https://github.com/%s' % login)
+
+    def _commit(self, i):
+        a = self._authors[i]
+        sha = hashlib.sha1(('%s:%d' % (self.full_name, i)).encode('utf-8')).hexdigest()
+        person = dict(name='Dev %d' % a, email='%s@example.com' % self.logins[a], date=_iso(self._time(i)))
+        return dict(sha=sha, url='/repos/%s/commits/%s' % (self.full_name, sha),
+                    commit=dict(author=person, committer=dict(person), message='Change %d of %s' % (i, self.name),
+                                tree=dict(sha=sha), comment_count=0),
+                    author=self._user(a), committer=self._user(a), parents=[])
+
+    def _select(self, author, since, until):
+        # commit i is newer than commit i+1, so time bounds become index bounds
+        lo, hi = 0, len(self._authors)
+        if until is not None:
+            lo = max(lo, -(-(self.end - until) // self.step) - 1)
+        if since is not None:
+            hi = min(hi, (self.end - since) // self.step)
+        if author is None:
+            return range(lo, max(lo, hi))
+        if author not in self.logins:
+            return []
+        indexes = self._by_author.get(self.logins.index(author), [])
+        return indexes[bisect.bisect_left(indexes, lo):bisect.bisect_left(indexes, hi)]
+
+    def _contributions(self):
+        return sorted([(len(self._by_author.get(a, [])), a) for a in range(len(self.logins)) if a in self._by_author], reverse=True)
+
+    def _contributor_stats(self):
+        if self._stats is None:
+            first = self._week(self._time(len(self._authors) - 1))
+            nweeks = (self._week(self.end) - first) // WEEK + 1
+            weeks = dict()
+            for i, a in enumerate(self._authors):
+                w = (self._week(self._time(i)) - first) // WEEK
+                row = weeks.setdefault(a, [[0, 0, 0] for n in range(nweeks)])
+                row[w][0] += 1
+                row[w][1] += self._changes[i][0]
+                row[w][2] += self._changes[i][1]
+            stats = []
+            for total, a in sorted(self._contributions()):
+                stats.append(dict(author=self._user(a), total=total,
+                                  weeks=[dict(w=first + n * WEEK, c=c, a=ad, d=d) for n, (c, ad, d) in enumerate(weeks[a])]))
+            code_frequency = [[first + n * WEEK, sum(weeks[a][n][1] for a in weeks), -sum(weeks[a][n][2] for a in weeks)]
+                              for n in range(nweeks)]
+            self._stats = (stats, code_frequency)
+        return self._stats
+
+    def _pending_stats(self, path):
+        n = self._pending.get(path, 0)
+        self._pending[path] = n + 1
+        return n < self.stats_pending
+
+    def write_git(self, path, files=16, window=20):
+        '''
+        Write the commits, oldest first, as a bare git repository at path with
+        the same authors, emails and dates. Every commit appends lines to one of
+        files files, which keep their last window lines, so git blame spreads
+        them over many authors.
+        '''
+        subprocess.check_call(['git', 'init', '--quiet', '--bare', path])
+        subprocess.check_call(['git', 'config', 'uploadpack.allowFilter', 'true'], cwd=path)
+        subprocess.check_call(['git', 'symbolic-ref', 'HEAD', 'refs/heads/master'], cwd=path)
+        marks = '%s.marks' % path
+        fast_import = subprocess.Popen(['git', 'fast-import', '--quiet', '--export-marks=%s' % marks],
+                                       cwd=path, stdin=subprocess.PIPE)
+        contents = [[] for f in range(files)]
+        n = len(self._authors)
+        out = fast_import.stdin
+        for i in range(n - 1, -1, -1):
+            a = self._authors[i]
+            lines = contents[i % files]
+            lines.extend('%d.%d %s' % (i, k, self.logins[a]) for k in range(1 + self._changes[i][0] % 3))
+            del lines[:-window]
+            data = ('\n'.join(lines) + '\n').encode('utf-8')
+            message = ('Change %d of %s\n' % (i, self.name)).encode('utf-8')
+            ident = 'Dev %d <%s@example.com> %d +0000' % (a, self.logins[a], self._time(i))
+            out.write(('commit refs/heads/master\nmark :%d\nauthor %s\ncommitter %s\ndata %d\n'
+                       % (n - i, ident, ident, len(message))).encode('utf-8') + message)
+            out.write(('M 644 inline f%d.txt\ndata %d\n' % (i % files, len(data))).encode('utf-8') + data + b'\n')
+        out.close()
+        if fast_import.wait():
+            raise subprocess.CalledProcessError(fast_import.returncode, 'git fast-import')
+        with open(marks) as f:
+            for line in f:
+                mark, sha = line.split()
+                self._git_shas[sha] = n - int(mark[1:])
+        os.remove(marks)
+
+    def summary(self):
+        return dict(id=int(hashlib.md5(self.full_name.encode('utf-8')).hexdigest()[:6], 16), name=self.name, full_name=self.full_name,
+                    owner=dict(login=self.owner), private=False, default_branch='master')
+
+    def handle(self, method, path, query):
+        '''
+        Return (status, headers, json) for a request, or None if it is not ours.
+        '''
+        prefix = '/repos/%s' % self.full_name
+        if path.startswith('/users/'):
+            login = path[len('/users/'):]
+            if login in self.logins:
+                return 200, dict(), dict(login=login, id=self.logins.index(login) + 1, name='Dev %d' % self.logins.index(login))
+            return None
+        if method!='GET' or not (path==prefix or path.startswith(prefix + '/')):
+            return None
+        rest = path[len(prefix):]
+        if rest=='':
+            return 200, dict(), self.summary()
+        if rest=='/contributors':
+            return self._page([dict(self._user(a), contributions=c) for c, a in self._contributions()], query, path)
+        if rest.startswith('/commits/') and rest[len('/commits/'):] in self._git_shas:
+            sha = rest[len('/commits/'):]
+            return 200, dict(), dict(self._commit(self._git_shas[sha]), sha=sha)
+        if rest=='/commits':
+            since = _parse_iso(query['since']) if 'since' in query else None
+            until = _parse_iso(query['until']) if 'until' in query else None
+            return self._page(_Lazy(self._select(query.get('author'), since, until), self._commit), query, path)
+        if rest in ('/stats/contributors', '/stats/code_frequency'):
+            if self._pending_stats(rest):
+                return 202, dict(), None
+            stats, code_frequency = self._contributor_stats()
+            return 200, dict(), stats if rest=='/stats/contributors' else code_frequency
+        return None
+
+    def _page(self, items, query, path):
+        return _page(items, query, path)
+
+def _page(items, query, path):
+    # one page of items with GitHub's Link header
+    per_page = min(int(query.get('per_page', 30)), 100)
+    page = int(query.get('page', 1))
+    start = (page - 1) * per_page
+    headers = dict()
+    last = max(1, -(-len(items) // per_page))
+    links = []
+    if page < last:
+        links.append('<%s>; rel="next"' % _page_url(path, query, page + 1))
+        links.append('<%s>; rel="last"' % _page_url(path, query, last))
+    if links:
+        headers['link'] = ', '.join(links)
+    return 200, headers, [items[i] for i in range(start, min(start + per_page, len(items)))]
+
+def _page_url(path, query, page):
+    q = dict(query, page=page)
+    return '%s?%s' % (path, github._encode_params(q))
+
+class _Lazy(object):
+
+    # sequence of indexes mapped through fn on access
+    def __init__(self, indexes, fn):
+        self._indexes = indexes
+        self._fn = fn
+
+    def __len__(self):
+        return len(self._indexes)
+
+    def __getitem__(self, i):
+        return self._fn(self._indexes[i])
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        # headers and body go out in separate writes; don't let Nagle delay the body
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        request_body = self.rfile.read(length) if length else b''
+        status, headers, body = self.server.standin.handle(self.command, self.path, self.headers, request_body)
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+_OWNER_REPOS_RE = re.compile(r'^/(?:orgs|users)/([^/]+)/repos$')
+_GRAPHQL_USER_RE = re.compile(r'(\w+)\s*:\s*user\(\s*login\s*:\s*"([^"]*)"\s*\)')
+
+class StandInServer(object):
+
+    '''
+    Local HTTP server standing in for api.github.com.
+
+    Serves the synthetic repos first, then the cassette, with latency seconds
+    added to every response. POST /graphql answers aliased user(login:)
+    lookups of the synthetic repos' contributors. Supports ETag/If-None-Match, gzip and sends
+    x-ratelimit-* headers. request_count counts requests served.
+    '''
+
+    def __init__(self, cassette=None, repos=(), latency=0.0, host='127.0.0.1', port=0, rate_limit=5000):
+        self.cassette = cassette
+        self.repos = list(repos)
+        self.latency = latency
+        self.request_count = 0
+        self.rate_limit = rate_limit
+        self._remaining = rate_limit
+        self._lock = threading.Lock()
+        self._address = (host, port)
+        self._server = None
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self._server.server_address[:2]
+
+    def start(self):
+        self._server = _ThreadingHTTPServer(self._address, _Handler)
+        self._server.standin = self
+        t = threading.Thread(target=self._server.serve_forever)
+        t.daemon = True
+        t.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _graphql(self, body):
+        # only user(login: "...") { login name } selections, one per alias
+        query = json.loads(body.decode('utf-8') or '{}').get('query', '')
+        data = {}
+        errors = []
+        for alias, login in _GRAPHQL_USER_RE.findall(query):
+            data[alias] = None
+            for repo in self.repos:
+                r = repo.handle('GET', '/users/%s' % login, {})
+                if r is not None:
+                    data[alias] = dict(login=r[2]['login'], name=r[2]['name'])
+                    break
+            else:
+                # as GitHub reports a login without an account
+                errors.append(dict(type='NOT_FOUND', path=[alias], message="Could not resolve to a User with the login of '%s'." % login))
+        reply = dict(data=data, errors=errors) if errors else dict(data=data)
+        return 200, dict(), json.dumps(reply).encode('utf-8')
+
+    def _route(self, method, path, body=b''):
+        parts = urlsplit(path)
+        query = dict(parse_qsl(parts.query))
+        if method=='POST' and parts.path=='/graphql':
+            return self._graphql(body)
+        # GET /orgs/:org/repos and /users/:user/repos list the synthetic repos of an owner
+        m = _OWNER_REPOS_RE.match(parts.path)
+        if method=='GET' and m:
+            owned = [repo.summary() for repo in self.repos if repo.owner==m.group(1)]
+            if owned:
+                status, headers, obj = _page(owned, query, parts.path)
+                return status, headers, json.dumps(obj).encode('utf-8')
+        for repo in self.repos:
+            r = repo.handle(method, parts.path, query)
+            if r is not None:
+                status, headers, obj = r
+                body = b'' if obj is None else json.dumps(obj).encode('utf-8')
+                return status, headers, body
+        if self.cassette:
+            i = self.cassette.play(method, path)
+            if i is not None:
+                return i['status'], dict(i['headers']), i['body'].encode('utf-8')
+        return 404, dict(), b'{"message":"Not Found"}'
+
+    def handle(self, method, path, request_headers, request_body=b''):
+        if self.latency:
+            time.sleep(self.latency)
+        status, headers, body = self._route(method, path, request_body)
+        headers.setdefault('content-type', 'application/json; charset=utf-8')
+        if 'link' in headers:
+            headers['link'] = headers['link'].replace('</', '<%s/' % self.url)
+        with self._lock:
+            self.request_count += 1
+            etag = headers.get('etag')
+            if status==200 and not etag:
+                etag = headers['etag'] = '"%s"' % hashlib.md5(body).hexdigest()
+            not_modified = status==200 and request_headers.get('If-None-Match')==etag
+            if not not_modified:
+                self._remaining = max(self._remaining - 1, 0)
+            headers['x-ratelimit-limit'] = str(self.rate_limit)
+            headers['x-ratelimit-remaining'] = str(self._remaining)
+            headers['x-ratelimit-reset'] = str(int(time.time()) + 3600)
+        if not_modified:
+            return 304, dict((k, v) for k, v in headers.items() if k!='content-type'), b''
+        if 'gzip' in (request_headers.get('Accept-Encoding') or '') and len(body) > 1024:
+            out = io.BytesIO()
+            with gzip.GzipFile(fileobj=out, mode='wb') as f:
+                f.write(body)
+            body = out.getvalue()
+            headers['content-encoding'] = 'gzip'
+        return status, headers, body
+
+def synthetic_repos(owner='synthetic', sizes=('small', 'medium', 'huge'), **kw):
+    '''
+    One SyntheticRepo per size, named owner/<size>.
+    '''
+    return [SyntheticRepo.of_size(owner, size, size, **kw) for size in sizes]
+
+def write_git_remotes(repos, root):
+    '''
+    Write every repo as a bare git repository under root.
+
+    Returns the url format, for repo links, of the written repositories, e.g.
+    for gitguard.MIRRORS = mirrors.MirrorStore(url_format=...).
+    '''
+    for repo in repos:
+        repo.write_git(os.path.join(root, repo.owner, '%s.git' % repo.name))
+    return 'file://%s/%%s.git' % os.path.abspath(root)
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description='Serve a GitHub API stand-in.')
+    parser.add_argument('cassette', nargs='?')
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--synthetic', default='', help='comma separated sizes served as synthetic/<size>')
+    args = parser.parse_args(argv[1:])
+    cassette = Cassette.load(args.cassette) if args.cassette else None
+    sizes = [s for s in args.synthetic.split(',') if s]
+    server = StandInServer(cassette, synthetic_repos(sizes=sizes), args.latency, port=args.port).start()
+    print('serving on %s' % server.url)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,228 @@
+import calendar
+import re
+import subprocess
+import time
+import git
+
+"""
+gitlog.py
+
+Streaming readers for git commands run in a local mirror (see mirrors.py).
+
+Output is parsed as it is produced instead of being collected into one
+string first, so scanning the history of a large repository keeps memory flat.
+"""
+
+CHUNK_SIZE = 64 * 1024
+
+# fields of a commit record, in the order of COMMIT_FORMAT
+COMMIT_FIELDS = ('sha', 'author_name', 'author_email', 'author_time', 'committer_time', 'message')
+COMMIT_FORMAT = '%H%x00%an%x00%ae%x00%at%x00%ct%x00%B'
+
+def _popen(repo, args):
+    return subprocess.Popen(('git',) + tuple(args), cwd=repo.git_dir, stdout=subprocess.PIPE)
+
+def _finish(process, args):
+    process.stdout.close()
+    if process.wait():
+        raise git.GitCommandError(('git',) + tuple(args), process.returncode)
+
+def _kill(process):
+    if process.poll() is None:
+        process.kill()
+        process.wait()
+
+def iter_lines(repo, *args):
+    """
+    Stream the output of a git command run in repo, one line at a time.
+
+    Args:
+        repo (git.Repo) : local repository or mirror
+        *args           : git command and its options
+
+    Returns:
+        generator of str, without the trailing newline
+    """
+    process = _popen(repo, args)
+    try:
+        for line in process.stdout:
+            yield line.decode('utf-8', 'replace').rstrip('\n')
+        _finish(process, args)
+    finally:
+        _kill(process)
+
+def iter_fields(repo, *args):
+    """
+    Stream the NUL separated fields printed by a git command, e.g. git log -z
+    with a format whose fields are joined by %x00.
+
+    Returns:
+        generator of str
+    """
+    process = _popen(repo, args)
+    try:
+        pending = b''
+        while True:
+            chunk = process.stdout.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            fields = (pending + chunk).split(b'\0')
+            pending = fields.pop()
+            for field in fields:
+                yield field.decode('utf-8', 'replace')
+        if pending:
+            yield pending.decode('utf-8', 'replace')
+        _finish(process, args)
+    finally:
+        _kill(process)
+
+def format_timestamp(timestamp):
+    """
+    Unix timestamp to the YYYY-MM-DDTHH:MM:SSZ format of the GitHub API.
+    """
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(int(timestamp)))
+
+def parse_timestamp(date):
+    """
+    YYYY-MM-DDTHH:MM:SSZ to a unix timestamp.
+    """
+    return calendar.timegm(time.strptime(date, '%Y-%m-%dT%H:%M:%SZ'))
+
+def iter_commits(repo, rev='HEAD', author=None, since=None, until=None, path=None, reverse=False):
+    """
+    Stream the commits reachable from rev, newest first.
+
+    Args:
+        repo (git.Repo)     : local repository or mirror
+        rev (str)           : revision to walk from
+        author (str)        : (optional) pattern matched against "name <email>", as git log --author
+        since (int)         : (optional) unix timestamp of the oldest commit date to include
+        until (int)         : (optional) unix timestamp of the newest commit date to include
+        path (str)          : (optional) only commits touching this path
+        reverse (bool)      : oldest first instead
+
+    Returns:
+        generator of dict with the keys in COMMIT_FIELDS; timestamps are ints and
+        message has no trailing newline
+    """
+    args = ['log', '-z', '--format=%s' % COMMIT_FORMAT]
+    if author:
+        args.append('--author=%s' % author)
+    if since is not None:
+        args.append('--since=@%d' % since)
+    if until is not None:
+        args.append('--until=@%d' % until)
+    if reverse:
+        args.append('--reverse')
+    args.append(rev)
+    if path:
+        args += ['--', path]
+    record = []
+    for field in iter_fields(repo, *args):
+        record.append(field)
+        if len(record) == len(COMMIT_FIELDS):
+            commit = dict(zip(COMMIT_FIELDS, record))
+            commit['author_time'] = int(commit['author_time'])
+            commit['committer_time'] = int(commit['committer_time'])
+            commit['message'] = commit['message'].rstrip('\n')
+            yield commit
+            record = []
+
+# fields of a numstat record, in the order of NUMSTAT_FORMAT
+NUMSTAT_FIELDS = ('sha', 'parents', 'author_name', 'author_email', 'author_time', 'committer_time', 'message')
+NUMSTAT_FORMAT = '%x01%H%x00%P%x00%an%x00%ae%x00%at%x00%ct%x00%B'
+
+def iter_numstat(repo, *revs):
+    """
+    Stream commits with the lines added and deleted in every file they touch
+    (git log --numstat). Renames are reported as a deletion and an addition.
+
+    Args:
+        repo (git.Repo)     : local repository or mirror
+        *revs               : revisions or ranges to walk, e.g. 'HEAD' or 'a1b2c3..HEAD'
+
+    Returns:
+        generator of dict with the keys in NUMSTAT_FIELDS and 'files', a list of
+        (path, additions, deletions); additions and deletions are None for binary files
+    """
+    commit = None
+    header = []
+    for field in iter_fields(repo, '-c', 'core.quotepath=off', 'log', '-z', '--numstat', '--no-renames',
+                             '--format=%s' % NUMSTAT_FORMAT, *revs):
+        if len(header) < len(NUMSTAT_FIELDS):
+            header.append(field)
+            if len(header) < len(NUMSTAT_FIELDS):
+                continue
+            header[0] = header[0].lstrip('\x01')
+            commit = dict(zip(NUMSTAT_FIELDS, header))
+            commit['parents'] = commit['parents'].split()
+            commit['author_time'] = int(commit['author_time'])
+            commit['committer_time'] = int(commit['committer_time'])
+            commit['message'] = commit['message'].rstrip('\n')
+            commit['files'] = []
+            continue
+        if field.startswith('\x01'):
+            yield commit
+            header = [field]
+            continue
+        field = field.lstrip('\n')
+        if not field:
+            continue
+        additions, deletions, path = field.split('\t', 2)
+        commit['files'].append((path,
+                                None if additions == '-' else int(additions),
+                                None if deletions == '-' else int(deletions)))
+    if commit is not None and len(header) == len(NUMSTAT_FIELDS):
+        yield commit
+
+LINE_LOG_FORMAT = '%x00%H%x00%an%x00%ae%x00%at'
+HUNK_HEADER_REGEX = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@')
+
+def iter_line_log(repo, ranges, rev='HEAD', author=None):
+    """
+    Stream the history of line ranges (git log -L), walking every range in one pass.
+    Only hunk headers are kept from the patches git prints.
+
+    Args:
+        repo (git.Repo)     : local repository or mirror
+        ranges (list)       : (path, start, end) line ranges, 1-based and inclusive
+        rev (str)           : revision to walk from
+        author (str)        : (optional) pattern matched against "name <email>", as git log --author
+
+    Returns:
+        generator of dict with keys sha, author_name, author_email, date (YYYY-MM-DDTHH:MM:SSZ)
+        and hunks, a list of dict with keys path, start and end: the lines of the tracked
+        range as of that commit (end is start - 1 when the commit left none of them)
+    """
+    args = ['log', '--no-ext-diff', '--no-color', '--format=%s' % LINE_LOG_FORMAT]
+    if author:
+        args.append('--author=%s' % author)
+    for path, start, end in ranges:
+        args.append('-L%d,%d:%s' % (start, end, path))
+    args.append(rev)
+    commit = None
+    path = None
+    in_header = False
+    for line in iter_lines(repo, *args):
+        if line.startswith('\0'):
+            if commit is not None:
+                yield commit
+            sha, name, email, timestamp = line[1:].split('\0')
+            commit = {'sha': sha, 'author_name': name, 'author_email': email,
+                      'date': format_timestamp(timestamp), 'hunks': []}
+        elif line.startswith('diff --git '):
+            in_header = True
+        elif in_header and line.startswith('+++ '):
+            path = line[4:]
+            if path.startswith('b/'):
+                path = path[2:]
+        elif line.startswith('@@ ') and commit is not None:
+            # patch lines start with ' ', '+' or '-', so this is always a hunk header
+            in_header = False
+            match = HUNK_HEADER_REGEX.match(line)
+            if match:
+                start = int(match.group(1))
+                count = int(match.group(2)) if match.group(2) is not None else 1
+                commit['hunks'].append({'path': path, 'start': start, 'end': start + count - 1})
+    if commit is not None:
+        yield commit
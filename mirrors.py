@@ -0,0 +1,454 @@
+import contextlib
+import os
+import shutil
+import stat
+import subprocess
+import threading
+import time
+import calendar
+import datetime
+import git
+from git import Repo
+
+try:
+    import fcntl
+except ImportError:
+    # no cross-process locking on Windows; threads are still serialised
+    fcntl = None
+
+"""
+mirrors.py
+
+Managed store of local bare mirrors of GitHub repositories.
+
+Mirrors are cloned once and then updated incrementally with git fetch. By
+default they are blobless partial clones: commits and trees are downloaded up
+front and file contents only when a query needs them, see prefetch_path. Date
+bounded queries can use shallow mirrors that stop at the oldest date asked for
+and are deepened on demand. Each repository is locked while it is cloned or fetched so concurrent commands
+don't clobber each other, and the least recently used mirrors are evicted
+once the store grows past its disk budget, except those leased with use.
+"""
+
+MIRROR_ROOT = './gitguard/'
+# bytes of mirrors kept on disk before the least recently used are evicted
+DISK_BUDGET = 10 * 1024 ** 3
+# seconds after a fetch during which a mirror is considered fresh
+FETCH_INTERVAL = 60
+REMOTE_URL_FORMAT = 'https://github.com/%s.git'
+
+# clone strategies: every object, commits and trees only, or commits and trees since a date
+STRATEGY_FULL = 'full'
+STRATEGY_BLOBLESS = 'blobless'
+STRATEGY_SHALLOW = 'shallow'
+
+_LAST_USED = 'gitguard-last-used'
+_SHALLOW_SINCE = 'gitguard-shallow-since'
+_SIZE = 'gitguard-size'
+_NULL_SHA = '0' * 40
+
+def _add_write_access(func, path, excinfo):
+    """
+    Helper function to remove change read-only file status to editable
+    Source: http://stackoverflow.com/questions/1889597/deleting-directory-in-python
+    """
+    os.chmod(path, stat.S_IWRITE)
+    func(path)
+
+def _timestamp(since):
+    if since is None or isinstance(since, (int, float)):
+        return since
+    if isinstance(since, datetime.datetime):
+        return calendar.timegm(since.utctimetuple())
+    return calendar.timegm(time.strptime(since, '%Y-%m-%dT%H:%M:%SZ'))
+
+def select_strategy(since=None, paths=None):
+    """
+    Pick the cheapest clone strategy able to answer a history query.
+
+    Args:
+        since           : (optional) oldest commit date the query looks at
+        paths           : (optional) files whose contents the query reads, e.g. for git log -L
+
+    Returns:
+        str: STRATEGY_SHALLOW for date bounded metadata queries, STRATEGY_BLOBLESS otherwise
+    """
+    if since is not None and not paths:
+        return STRATEGY_SHALLOW
+    return STRATEGY_BLOBLESS
+
+def _dir_size(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+class _RepoLock(object):
+    """
+    Lock on one mirror, held across threads (threading.Lock) and processes
+    (flock on a lock file next to the mirror).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def acquire(self, blocking=True):
+        if not self._lock.acquire(blocking):
+            return False
+        if fcntl:
+            try:
+                self._file = open(self.path, 'a')
+                fcntl.flock(self._file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                if self._file:
+                    self._file.close()
+                    self._file = None
+                self._lock.release()
+                if blocking:
+                    raise
+                return False
+        return True
+
+    def release(self):
+        if self._file:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class MirrorStore(object):
+    """
+    Store of bare mirrors, one per repository, under root.
+
+    Args:
+        root (str)              : directory holding the mirrors
+        disk_budget (int)       : bytes kept before least recently used mirrors are evicted
+        fetch_interval (int)    : seconds after a fetch during which a mirror is not fetched again
+        url_format (str)        : remote url for a repo_link
+        strategy (str)          : clone strategy for new mirrors when the caller doesn't pick one
+    """
+
+    def __init__(self, root=MIRROR_ROOT, disk_budget=DISK_BUDGET, fetch_interval=FETCH_INTERVAL, url_format=REMOTE_URL_FORMAT, strategy=STRATEGY_BLOBLESS):
+        self.root = root
+        self.strategy = strategy
+        self.disk_budget = disk_budget
+        self.fetch_interval = fetch_interval
+        self.url_format = url_format
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        # path --> leases held in this process
+        self._leases = {}
+
+    def path(self, repo_link):
+        owner, repo = [part.strip() for part in repo_link.split('/')]
+        return os.path.join(self.root, owner, '%s.git' % repo)
+
+    def _lock(self, path):
+        with self._locks_lock:
+            lock = self._locks.get(path)
+            if lock is None:
+                if not os.path.isdir(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                lock = self._locks[path] = _RepoLock('%s.lock' % path)
+            return lock
+
+    def get(self, repo_link, fetch=True, strategy=None, since=None, paths=None):
+        """
+        Return an up to date bare mirror of a repository, cloning it on first use.
+        The mirror isn't leased, so it may be evicted while it is read; use the
+        use context manager for anything but a quick check.
+
+        Args:
+            repo_link (str)     : owner/repo format
+            fetch (bool)        : fetch new commits if the mirror is older than fetch_interval
+            strategy (str)      : (optional) clone strategy, defaults to select_strategy(since, paths)
+                                  or the store's strategy
+            since               : (optional) oldest commit date needed, as a datetime, unix
+                                  timestamp or ISO 8601 string; a shallow mirror is deepened to it
+            paths (list)        : (optional) files whose contents are fetched for every revision
+
+        Returns:
+            git.Repo: the bare mirror; HEAD is the remote's default branch
+        """
+        path, lease = self._update(repo_link, fetch, strategy, since, paths, lease=False)
+        return Repo(path)
+
+    @contextlib.contextmanager
+    def use(self, repo_link, fetch=True, strategy=None, since=None, paths=None):
+        """
+        Like get, but the mirror is leased until the with block exits: evict skips
+        it in the meantime, in this process and, where flock exists, in others.
+
+            with store.use('owner/repo') as repo:
+                ...
+        """
+        path, lease = self._update(repo_link, fetch, strategy, since, paths, lease=True)
+        try:
+            yield Repo(path)
+        finally:
+            self._unlease(path, lease)
+
+    def _update(self, repo_link, fetch, strategy, since, paths, lease):
+        if strategy is None:
+            strategy = select_strategy(since, paths) if since is not None or paths else self.strategy
+        since = _timestamp(since) if strategy == STRATEGY_SHALLOW else None
+        path = self.path(repo_link)
+        handle = None
+        with self._lock(path):
+            if not os.path.isdir(path):
+                self._clone(repo_link, path, strategy, since)
+            else:
+                repo = Repo(path)
+                if fetch and time.time() - self._last_fetch(path) > self.fetch_interval:
+                    self._fetch(repo)
+                self._complete(repo_link, path, strategy)
+                self._deepen(Repo(path), strategy, since)
+            if paths:
+                repo = Repo(path)
+                for file_path in paths:
+                    self.prefetch_path(repo, file_path)
+            self._touch(path)
+            # taken under the repo lock, which evict holds while it checks and removes
+            if lease:
+                handle = self._lease(path)
+        try:
+            self.evict(keep=path)
+        except:
+            if lease:
+                self._unlease(path, handle)
+            raise
+        return path, handle
+
+    def _lease(self, path):
+        handle = None
+        if fcntl:
+            handle = open('%s.use' % path, 'a')
+            fcntl.flock(handle, fcntl.LOCK_SH)
+        with self._locks_lock:
+            self._leases[path] = self._leases.get(path, 0) + 1
+        return handle
+
+    def _unlease(self, path, handle):
+        with self._locks_lock:
+            count = self._leases.get(path, 0) - 1
+            if count > 0:
+                self._leases[path] = count
+            else:
+                self._leases.pop(path, None)
+        if handle:
+            # closing the file drops its shared flock
+            handle.close()
+
+    def _in_use(self, path):
+        with self._locks_lock:
+            if self._leases.get(path):
+                return True
+        if not fcntl:
+            return False
+        try:
+            handle = open('%s.use' % path, 'a')
+        except (IOError, OSError):
+            return False
+        try:
+            # fails while any process, this one included, holds a shared lease
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return False
+        except (IOError, OSError):
+            return True
+        finally:
+            handle.close()
+
+    def _clone(self, repo_link, path, strategy=STRATEGY_FULL, since=None):
+        tmp = '%s.tmp-%d' % (path, os.getpid())
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp, onerror=_add_write_access)
+        options = {}
+        if strategy != STRATEGY_FULL:
+            options['filter'] = 'blob:none'
+        if since is not None:
+            options['shallow_since'] = '@%d' % since
+        repo = Repo.clone_from(self.url_format % repo_link, tmp, bare=True, **options)
+        # only mirror branches and tags, not GitHub's refs/pull/*
+        repo.git.config('remote.origin.fetch', '+refs/heads/*:refs/heads/*')
+        repo.git.config('--add', 'remote.origin.fetch', '+refs/tags/*:refs/tags/*')
+        if since is not None:
+            with open(os.path.join(tmp, _SHALLOW_SINCE), 'w') as f:
+                f.write('%d\n' % since)
+        os.rename(tmp, path)
+        self._mark_fetched(path)
+
+    def _fetch(self, repo):
+        repo.git.fetch('--prune', 'origin')
+        self._sync_head(repo)
+        self._mark_fetched(repo.git_dir)
+
+    def _deepen(self, repo, strategy, since):
+        marker = os.path.join(repo.git_dir, _SHALLOW_SINCE)
+        if not os.path.exists(os.path.join(repo.git_dir, 'shallow')):
+            return
+        try:
+            with open(marker) as f:
+                shallow_since = int(f.read())
+        except (IOError, ValueError):
+            # shallow for an unknown depth
+            shallow_since = None
+        if strategy == STRATEGY_SHALLOW:
+            # no date asked for, or already deep enough
+            if since is None or (shallow_since is not None and since >= shallow_since):
+                return
+        if strategy == STRATEGY_SHALLOW:
+            repo.git.fetch('--shallow-since=@%d' % since, 'origin')
+            with open(marker, 'w') as f:
+                f.write('%d\n' % since)
+        else:
+            repo.git.fetch('--unshallow', 'origin')
+            if os.path.exists(marker):
+                os.remove(marker)
+        self._record_size(repo.git_dir)
+
+    def _complete(self, repo_link, path, strategy):
+        # a full mirror was asked of a partial clone: reclone it in full, which is
+        # much cheaper than fetching the missing blobs into a promisor repository
+        if strategy != STRATEGY_FULL or not Repo(path).git.config('--get', 'remote.origin.partialclonefilter', with_exceptions=False):
+            return
+        old = '%s.old-%d' % (path, os.getpid())
+        os.rename(path, old)
+        try:
+            self._clone(repo_link, path, STRATEGY_FULL)
+        except:
+            os.rename(old, path)
+            raise
+        # keep files other modules store in the mirror, e.g. the commit index
+        for name in os.listdir(old):
+            if name.startswith('gitguard-') and name not in (_SHALLOW_SINCE, _SIZE):
+                os.rename(os.path.join(old, name), os.path.join(path, name))
+        shutil.rmtree(old, onerror=_add_write_access)
+
+    def prefetch_path(self, repo, file_path, rev='HEAD'):
+        """
+        Download in one round trip every version of a file a partial clone is missing,
+        instead of letting git fetch them one at a time while walking history.
+
+        Args:
+            repo (git.Repo)     : mirror returned by get
+            file_path (str)     : path to file in repo
+            rev (str)           : revision whose history is walked
+        """
+        if not repo.git.config('--get', 'remote.origin.promisor', with_exceptions=False):
+            return
+        blobs = set()
+        for line in repo.git.log('--format=', '--raw', '--no-abbrev', rev, '--', file_path).splitlines():
+            fields = line.split()
+            if len(fields) > 3 and fields[3] != _NULL_SHA:
+                blobs.add(fields[3])
+        if not blobs:
+            return
+        # objects already present are skipped without contacting the remote
+        fetch = subprocess.Popen(['git', '-c', 'fetch.negotiationAlgorithm=noop', 'fetch', '--quiet', 'origin',
+                                  '--no-tags', '--no-write-fetch-head', '--recurse-submodules=no', '--stdin'],
+                                 cwd=repo.git_dir, stdin=subprocess.PIPE)
+        fetch.communicate(('\n'.join(sorted(blobs)) + '\n').encode('ascii'))
+        if fetch.returncode:
+            raise git.GitCommandError(['git', 'fetch', '--stdin'], fetch.returncode)
+        self._record_size(repo.git_dir)
+
+    def _sync_head(self, repo):
+        # follow the remote if its default branch was renamed
+        for line in repo.git.ls_remote('--symref', 'origin', 'HEAD').splitlines():
+            if line.startswith('ref: ') and line.endswith('\tHEAD'):
+                head = line[len('ref: '):-len('\tHEAD')]
+                if head != repo.git.symbolic_ref('HEAD'):
+                    repo.git.symbolic_ref('HEAD', head)
+                return
+
+    def _mark_fetched(self, path):
+        with open(os.path.join(path, 'FETCH_TIME'), 'w') as f:
+            f.write('%d\n' % time.time())
+        self._record_size(path)
+
+    def _record_size(self, path):
+        # walking the objects is slow on big mirrors, so only do it after they change
+        with open(os.path.join(path, _SIZE), 'w') as f:
+            f.write('%d\n' % _dir_size(path))
+
+    def _size(self, path):
+        try:
+            with open(os.path.join(path, _SIZE)) as f:
+                return int(f.read())
+        except (IOError, ValueError):
+            return _dir_size(path)
+
+    def _last_fetch(self, path):
+        try:
+            return os.path.getmtime(os.path.join(path, 'FETCH_TIME'))
+        except OSError:
+            return 0
+
+    def _touch(self, path):
+        marker = os.path.join(path, _LAST_USED)
+        with open(marker, 'a'):
+            os.utime(marker, None)
+
+    def _mirrors(self):
+        if not os.path.isdir(self.root):
+            return []
+        mirrors = []
+        for owner in os.listdir(self.root):
+            owner_dir = os.path.join(self.root, owner)
+            if not os.path.isdir(owner_dir):
+                continue
+            for name in os.listdir(owner_dir):
+                path = os.path.join(owner_dir, name)
+                if name.endswith('.git') and os.path.isdir(path):
+                    try:
+                        last_used = os.path.getmtime(os.path.join(path, _LAST_USED))
+                    except OSError:
+                        last_used = 0
+                    mirrors.append((last_used, path))
+        return mirrors
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used mirrors until the store fits its disk budget.
+        Mirrors being cloned or fetched, or leased with use, are skipped.
+
+        Args:
+            keep (str): path of a mirror never to evict
+
+        Returns:
+            list: paths of the evicted mirrors
+        """
+        mirrors = sorted(self._mirrors())
+        sizes = dict((path, self._size(path)) for _, path in mirrors)
+        total = sum(sizes.values())
+        evicted = []
+        for last_used, path in mirrors:
+            if total <= self.disk_budget:
+                break
+            if path == keep:
+                continue
+            lock = self._lock(path)
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                if self._in_use(path):
+                    continue
+                shutil.rmtree(path, onerror=_add_write_access)
+            finally:
+                lock.release()
+            total -= sizes[path]
+            evicted.append(path)
+        return evicted
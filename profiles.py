@@ -0,0 +1,187 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import github
+
+"""
+profiles.py
+
+Persistent cache of GitHub user profiles (login --> name) and batch
+resolution of the logins it doesn't know yet, either with concurrent
+GET /users/:login requests or with one aliased GraphQL query per 100 logins.
+"""
+
+PROFILES_FILE = 'profiles.sqlite'
+# seconds a profile is trusted for; names rarely change
+PROFILE_TTL = 7 * 24 * 60 * 60
+NOT_FOUND_TTL = 24 * 60 * 60
+# concurrent requests when resolving over REST
+WORKERS = 8
+# logins per GraphQL query
+GRAPHQL_BATCH = 100
+
+RESOLVER_REST = 'rest'
+RESOLVER_GRAPHQL = 'graphql'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS profiles (
+    api TEXT,
+    login TEXT,
+    found INTEGER,
+    name TEXT,
+    fetched_at INTEGER,
+    PRIMARY KEY (api, login)
+);
+'''
+
+def _fetch_rest(gh, logins, workers):
+    def fetch(login):
+        try:
+            return login, True, gh.users(login).get()['name']
+        except github.ApiNotFoundError:
+            return login, False, None
+    with ThreadPoolExecutor(max(1, min(workers, len(logins)))) as executor:
+        return dict((login, (found, name)) for login, found, name in executor.map(fetch, logins))
+
+def _fetch_graphql(gh, logins):
+    profiles = {}
+    for i in range(0, len(logins), GRAPHQL_BATCH):
+        batch = logins[i:i + GRAPHQL_BATCH]
+        query = '{ %s }' % ' '.join('u%d: user(login: %s) { login name }' % (j, json.dumps(login))
+                                     for j, login in enumerate(batch))
+        reply = gh.graphql.post(query=query)
+        # a login without an account is a null alias with a NOT_FOUND error on its
+        # path; any other error, e.g. RATE_LIMITED, fails the whole batch
+        missing = set()
+        for error in reply.get('errors') or []:
+            path = error.get('path') or []
+            if error.get('type') != 'NOT_FOUND' or len(path) != 1:
+                url = '%s/graphql' % gh._api_url
+                raise github.ApiError(url, github.JsonObject(method='POST', url=url), github.JsonObject(code=200, json=reply))
+            missing.add(path[0])
+        data = reply.get('data') or {}
+        for j, login in enumerate(batch):
+            alias = 'u%d' % j
+            user = data.get(alias)
+            if user:
+                profiles[login] = (True, user['name'])
+            elif alias in missing:
+                profiles[login] = (False, None)
+    return profiles
+
+def fetch_names(gh, logins, resolver=RESOLVER_REST, workers=WORKERS):
+    """
+    Look up the profile names of many logins.
+
+    Args:
+        gh                  : github.GitHub client, ideally authenticated
+        logins (list)       : GitHub usernames
+        resolver (str)      : RESOLVER_REST for concurrent users/:login requests or
+                              RESOLVER_GRAPHQL for aliased GraphQL queries, which GitHub
+                              only answers for authenticated clients
+        workers (int)       : concurrent requests for RESOLVER_REST
+
+    Returns:
+        dict: login --> (found, name); name is None for users without one. Logins
+        GraphQL answered null for without saying they don't exist are left out
+
+    Raises github.ApiError if a GraphQL reply has errors other than NOT_FOUND logins.
+    """
+    logins = list(logins)
+    if not logins:
+        return {}
+    if resolver == RESOLVER_GRAPHQL:
+        return _fetch_graphql(gh, logins)
+    return _fetch_rest(gh, logins, workers)
+
+class UserProfileCache(object):
+    """
+    Profiles stored in SQLite, per API url, trusted for PROFILE_TTL seconds
+    (NOT_FOUND_TTL for logins without an account).
+
+    Args:
+        path (str)  : SQLite database file, created on first use
+    """
+
+    def __init__(self, path, ttl=PROFILE_TTL, not_found_ttl=NOT_FOUND_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.not_found_ttl = not_found_ttl
+        self._created = False
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        with self._lock:
+            if not self._created:
+                directory = os.path.dirname(self.path)
+                if directory and not os.path.isdir(directory):
+                    os.makedirs(directory)
+                connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+                connection.execute('PRAGMA journal_mode=WAL')
+                connection.executescript(SCHEMA)
+                self._created = True
+                return connection
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    def get_many(self, api, logins):
+        """
+        Returns:
+            dict: login --> (found, name) for the logins with a fresh profile
+        """
+        now = int(time.time())
+        profiles = {}
+        connection = self._connect()
+        logins = list(set(logins))
+        try:
+            # stay under SQLite's limit on bound parameters
+            for i in range(0, len(logins), 500):
+                batch = logins[i:i + 500]
+                rows = connection.execute('SELECT login, found, name, fetched_at FROM profiles WHERE api = ? AND login IN (%s)'
+                                          % ', '.join('?' * len(batch)), [api] + batch)
+                for login, found, name, fetched_at in rows:
+                    if now - fetched_at < (self.ttl if found else self.not_found_ttl):
+                        profiles[login] = (bool(found), name)
+        finally:
+            connection.close()
+        return profiles
+
+    def put_many(self, api, profiles):
+        """
+        Args:
+            profiles (dict) : login --> (found, name)
+        """
+        now = int(time.time())
+        connection = self._connect()
+        try:
+            connection.executemany('INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?, ?)',
+                                   [(api, login, int(found), name, now) for login, (found, name) in profiles.items()])
+        finally:
+            connection.close()
+
+    def resolve(self, gh, logins, resolver=RESOLVER_REST, workers=WORKERS):
+        """
+        Names of many logins, from the cache where fresh and fetched in one batch otherwise.
+        Nothing is cached if the fetch fails.
+
+        Returns:
+            dict: login --> name, None for unknown logins and users without a name
+        """
+        api = gh._api_url
+        profiles = self.get_many(api, logins)
+        missing = [login for login in set(logins) if login not in profiles]
+        if missing:
+            fetched = fetch_names(gh, missing, resolver, workers)
+            self.put_many(api, fetched)
+            profiles.update(fetched)
+        return dict((login, profiles.get(login, (False, None))[1]) for login in logins)
+
+    def clear(self):
+        connection = self._connect()
+        try:
+            connection.execute('DELETE FROM profiles')
+        finally:
+            connection.close()
@@ -0,0 +1,38 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import batch
+import github
+import gitguard
+
+def _latest_commit(repo_link, snapshot):
+    if repo_link == 'owner/bad':
+        # as get_latest_commit_summary raises for a committer without an account
+        committer = None
+        return committer['login']
+    return repo_link
+
+class BatchAnalysisTest(unittest.TestCase):
+
+    def test_error_in_one_repo_does_not_stop_the_batch(self):
+        extractors = [('latest_commit', _latest_commit)]
+        analysis = batch.BatchAnalysis(workers=2, extractors=extractors, gh=object())
+        results = dict((result['repo'], result) for result in analysis.run(['owner/a', 'owner/bad', 'owner/b']))
+
+        self.assertEqual(sorted(results), ['owner/a', 'owner/b', 'owner/bad'])
+        self.assertIsInstance(results['owner/bad']['error'], TypeError)
+        for repo_link in ('owner/a', 'owner/b'):
+            self.assertIsNone(results[repo_link]['error'])
+            self.assertEqual(results[repo_link]['results']['latest_commit'], repo_link)
+    def test_client_shares_the_credentials_scheduler_at_background_priority(self):
+        analysis = batch.BatchAnalysis('user', 'secret', workers=2)
+        interactive = gitguard._client('user', 'secret')
+
+        self.assertIs(analysis.gh._scheduler, interactive._scheduler)
+        self.assertEqual(analysis.gh._priority, github.PRIORITY_BACKGROUND)
+        self.assertEqual(interactive._priority, github.PRIORITY_INTERACTIVE)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import github
+import github_replay
+import profiles
+
+class GraphQLResolverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = github_replay.StandInServer(repos=github_replay.synthetic_repos(sizes=['small'])).start()
+        self.gh = github.GitHub(api_url=self.server.url, plain_json=True)
+        self.tmp = tempfile.mkdtemp()
+        self.cache = profiles.UserProfileCache(os.path.join(self.tmp, profiles.PROFILES_FILE))
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp)
+
+    def test_only_not_found_logins_are_cached_as_missing(self):
+        names = self.cache.resolve(self.gh, ['small-dev1', 'nobody'], profiles.RESOLVER_GRAPHQL)
+
+        self.assertEqual(names, {'small-dev1': 'Dev 1', 'nobody': None})
+        self.assertEqual(self.cache.get_many(self.gh._api_url, ['small-dev1', 'nobody']),
+                         {'small-dev1': (True, 'Dev 1'), 'nobody': (False, None)})
+
+    def test_failed_batch_raises_and_caches_nothing(self):
+        graphql = self.server._graphql
+        self.server._graphql = lambda body: (200, dict(), b'{"data": null, "errors": [{"type": "RATE_LIMITED"}]}')
+        with self.assertRaises(github.ApiError):
+            self.cache.resolve(self.gh, ['small-dev1', 'small-dev2'], profiles.RESOLVER_GRAPHQL)
+        self.server._graphql = lambda body: (200, dict(), b'{"errors": [{"type": "RATE_LIMITED"}]}')
+        with self.assertRaises(github.ApiError):
+            self.cache.resolve(self.gh, ['small-dev1', 'small-dev2'], profiles.RESOLVER_GRAPHQL)
+        self.assertEqual(self.cache.get_many(self.gh._api_url, ['small-dev1', 'small-dev2']), {})
+
+        self.server._graphql = graphql
+        self.assertEqual(self.cache.resolve(self.gh, ['small-dev1', 'small-dev2'], profiles.RESOLVER_GRAPHQL),
+                         {'small-dev1': 'Dev 1', 'small-dev2': 'Dev 2'})
+
+if __name__ == '__main__':
+    unittest.main()
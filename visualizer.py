@@ -29,13 +29,16 @@ def _make_plot(data, layout, out_file='out.png'):
     return
 
 def _get_team_contribution_data_layout(repo_link, username=None, password=None):
-    contributor_names = gitguard.get_repo_contributors(repo_link, username, password)
+    snapshot = gitguard.RepoSnapshot(repo_link, username, password)
+    contributor_names = gitguard.get_repo_contributors(repo_link, snapshot=snapshot)
+    # one stats request for the whole team
+    stats = gitguard.get_stats_for_all_authors(repo_link, snapshot=snapshot)
     contributor_commits = []
     contributor_insertions = []
     contributor_deletions = []
 
     for contributor in contributor_names:
-        c, a, d = gitguard.get_stats_by_author(repo_link, contributor, username, password)
+        c, a, d = stats.get(contributor, (0, 0, 0))
         contributor_commits.append(c)
         contributor_insertions.append(a)
         contributor_deletions.append(d)
@@ -103,8 +106,8 @@ def get_team_contribution_summary(repo_link, out_file, username=None, password=N
 def _extract_date_from_timestamp(timestamp):
     return dateutil.parser.parse(timestamp).date()
     
-def _get_commit_history_for_author(repo_link, author_name=None, start=None, end=None, path=None, username=None, password=None):
-    commit_history = gitguard.get_commit_history(repo_link, author_name, start, end, path, username, password)
+def _get_commit_history_for_author(repo_link, author_name=None, start=None, end=None, path=None, username=None, password=None, snapshot=None):
+    commit_history = gitguard.get_commit_history(repo_link, author_name, start, end, path, username, password, snapshot)
     commit_counts = _histogram_commit_history(commit_history)
     return _extract_x_y_data(commit_counts)
 
@@ -127,11 +130,12 @@ def _extract_x_y_data(histogram):
         y.append(histogram[key])
     return x, y
 
-def _get_team_commit_history_data_layout(repo_link, team, start=None, end=None, path=None, username=None, password=None):
+def _get_team_commit_history_data_layout(repo_link, team, start=None, end=None, path=None, username=None, password=None, snapshot=None):
     data = []
+    snapshot = snapshot or gitguard.RepoSnapshot(repo_link, username, password)
     # make a Scatter graph object (trace) for each author labelled appropriately
     for author in team:
-        timestamps, commits = _get_commit_history_for_author(repo_link, author, start, end, path, username, password)
+        timestamps, commits = _get_commit_history_for_author(repo_link, author, start, end, path, username, password, snapshot)
         trace = go.Scatter(
             x = timestamps,
             y = commits,
@@ -156,8 +160,9 @@ def _get_team_commit_history_data_layout(repo_link, team, start=None, end=None,
     return data, layout
 
 def get_team_commit_history(repo_link, out_file, start=None, end=None, path=None, username=None, password=None):
-    team = gitguard.get_repo_contributors(repo_link)
-    data, layout = _get_team_commit_history_data_layout(repo_link, team)
+    snapshot = gitguard.RepoSnapshot(repo_link, username, password)
+    team = gitguard.get_repo_contributors(repo_link, snapshot=snapshot)
+    data, layout = _get_team_commit_history_data_layout(repo_link, team, snapshot=snapshot)
     _make_plot(data, layout, out_file)
     return
 
@@ -171,13 +176,14 @@ def get_team_total_lines_summary(repo_link, out_file, username=None, password=No
     return
 
 def _get_team_total_lines_layout(repo_link, username=None, password=None):
-    contributor_names = gitguard.get_repo_contributors(repo_link, username, password)
+    snapshot = gitguard.RepoSnapshot(repo_link, username, password)
+    contributor_names = gitguard.get_repo_contributors(repo_link, snapshot=snapshot)
+    # lines at HEAD owned by each contributor, blamed locally
+    lines = gitguard.get_lines_by_author(repo_link, snapshot=snapshot)
     contributor_lines = []
 
     for contributor in contributor_names:
-        c, a, d = gitguard.get_stats_by_author(repo_link, contributor, username, password)
-        l = a - d;
-        contributor_lines.append(l)
+        contributor_lines.append(lines.get(contributor, 0))
         
     trace_lines =  go.Bar(
         x = contributor_names,
@@ -0,0 +1,156 @@
+import numpy as np
+
+"""
+weekly_stats.py
+
+Dense NumPy views of GitHub's weekly statistics.
+
+stats/contributors is loaded once into an authors x weeks x (commits,
+additions, deletions) array with cumulative sums over the weeks, so totals
+over any range of weeks, for one author or all of them, are a subtraction of
+two slices instead of a rescan of the weeks lists.
+"""
+
+COMMITS = 0
+ADDITIONS = 1
+DELETIONS = 2
+METRICS = {'c': COMMITS, 'a': ADDITIONS, 'd': DELETIONS}
+
+WEEK = 7 * 24 * 60 * 60
+
+class ContributorMatrix(object):
+    """
+    Weekly commits, additions and deletions of every author of a repository.
+
+    Args:
+        authors (list)      : usernames, one per row
+        weeks (array)       : unix timestamp of the start of every week, ascending
+        data (array)        : int array of shape (authors, weeks, 3)
+    """
+
+    def __init__(self, authors, weeks, data):
+        self.authors = list(authors)
+        self.weeks = np.asarray(weeks, dtype=np.int64)
+        self.data = np.asarray(data, dtype=np.int64).reshape(len(self.authors), len(self.weeks), 3)
+        self._rows = dict((author, i) for i, author in enumerate(self.authors))
+        # prefix[:, j] is the total of weeks [0, j)
+        self.prefix = np.zeros((len(self.authors), len(self.weeks) + 1, 3), dtype=np.int64)
+        np.cumsum(self.data, axis=1, out=self.prefix[:, 1:])
+
+    @classmethod
+    def from_stats(cls, repo_data):
+        """
+        Build the matrix from a stats/contributors payload. Deleted accounts,
+        which have no author, are left out.
+        """
+        repo_data = [entry for entry in repo_data if entry['author']]
+        weeks = sorted(set(week['w'] for entry in repo_data for week in entry['weeks']))
+        columns = dict((week, j) for j, week in enumerate(weeks))
+        data = np.zeros((len(repo_data), len(weeks), 3), dtype=np.int64)
+        for i, entry in enumerate(repo_data):
+            for week in entry['weeks']:
+                data[i, columns[week['w']]] = (week['c'], week['a'], week['d'])
+        return cls([entry['author']['login'] for entry in repo_data], weeks, data)
+
+    def _columns(self, start=None, end=None):
+        # weeks starting in [start, end)
+        i = 0 if start is None else int(np.searchsorted(self.weeks, start, 'left'))
+        j = len(self.weeks) if end is None else int(np.searchsorted(self.weeks, end, 'left'))
+        return i, max(i, j)
+
+    def totals(self, start=None, end=None):
+        """
+        Commits, additions and deletions of every author over the weeks starting
+        in [start, end), as an array of shape (authors, 3).
+
+        Args:
+            start (int) : (optional) unix timestamp, defaults to the first week
+            end (int)   : (optional) unix timestamp, defaults to after the last week
+        """
+        i, j = self._columns(start, end)
+        return self.prefix[:, j] - self.prefix[:, i]
+
+    def author_totals(self, author, start=None, end=None):
+        """
+        Returns:
+            tuple: (commits, additions, deletions) of one author, None if unknown
+        """
+        row = self._rows.get(author)
+        if row is None:
+            return None
+        i, j = self._columns(start, end)
+        return tuple(int(x) for x in self.prefix[row, j] - self.prefix[row, i])
+
+    def by_author(self, start=None, end=None):
+        """
+        Returns:
+            dict: author's username --> (commits, additions, deletions)
+        """
+        totals = self.totals(start, end).tolist()
+        return dict((author, tuple(total)) for author, total in zip(self.authors, totals))
+
+    def top(self, k, start=None, end=None, metric='c'):
+        """
+        Authors with the highest metric over the weeks starting in [start, end).
+
+        Args:
+            k (int)         : number of authors
+            metric (str)    : 'c' commits, 'a' additions or 'd' deletions
+
+        Returns:
+            list of (author, commits, additions, deletions), highest first
+        """
+        totals = self.totals(start, end)
+        if not len(self.authors) or k <= 0:
+            return []
+        values = totals[:, METRICS[metric]]
+        k = min(k, len(values))
+        rows = np.argpartition(-values, k - 1)[:k]
+        rows = rows[np.argsort(-values[rows], kind='mergesort')]
+        return [(self.authors[row],) + tuple(int(x) for x in totals[row]) for row in rows]
+
+    def last_full_week(self, now):
+        """
+        Returns:
+            tuple: (start, end) timestamps of the last week that ended before now
+        """
+        if len(self.weeks):
+            # weeks are aligned on GitHub's week boundaries
+            start = int(self.weeks[-1]) + ((int(now) - int(self.weeks[-1])) // WEEK - 1) * WEEK
+        else:
+            start = int(now) - 2 * WEEK
+        return start, start + WEEK
+
+def iter_author_totals(repo_data, start=None, end=None):
+    """
+    Stream the commits, additions and deletions of every author of a
+    stats/contributors payload over the weeks starting in [start, end), one
+    author at a time and without building the matrix. Deleted accounts are
+    left out.
+
+    Returns:
+        generator of (author, commits, additions, deletions)
+    """
+    for entry in repo_data:
+        if not entry['author']:
+            continue
+        commits = additions = deletions = 0
+        for week in entry['weeks']:
+            if (start is None or week['w'] >= start) and (end is None or week['w'] < end):
+                commits += week['c']
+                additions += week['a']
+                deletions += week['d']
+        yield entry['author']['login'], commits, additions, deletions
+
+def code_frequency_totals(weekly_data):
+    """
+    Total additions and deletions from a stats/code_frequency payload, a list of
+    [week, additions, deletions] with deletions negative.
+
+    Returns:
+        tuple: (additions, deletions), deletions as a positive number
+    """
+    if not weekly_data:
+        return 0, 0
+    totals = np.asarray(weekly_data, dtype=np.int64)[:, 1:].sum(axis=0)
+    return int(totals[0]), -int(totals[1])